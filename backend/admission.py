@@ -0,0 +1,134 @@
+# admission.py
+import os
+import math
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+import metrics
+
+# Default (max concurrent, max waiting) per stage; override with
+# ADMISSION_<STAGE>_CONCURRENCY / ADMISSION_<STAGE>_QUEUE
+DEFAULT_LIMITS = {
+    "transcribe": (2, 8),
+    "rewrite": (8, 32),
+    "synthesize": (2, 8),
+    "setup": (1, 4),
+}
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+MAX_ADMITTED_REQUESTS = int(os.getenv("ADMISSION_MAX_REQUESTS", "16"))  # requests past ingress, running or waiting
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing work the server can't start soon; maps to 429/503 with Retry-After."""
+
+    def __init__(self, stage: str, retry_after: int, status_code: int = 503):
+        super().__init__(f"Server busy ({stage}), retry in {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+rejected = metrics.Counter("voicemask_admission_rejected_total", "Work turned away by admission control.", ["stage"])
+waiting = metrics.Gauge("voicemask_stage_waiting", "Callers queued for a stage slot.", ["stage"])
+
+
+class StageLimiter:
+    """Bounds how many callers run a stage at once and how many may wait for a slot."""
+
+    def __init__(self, name: str, max_concurrency: int, max_waiting: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.avg_seconds = 1.0  # moving average of time a slot is held
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / self.max_concurrency))
+
+    def _reject(self):
+        rejected.inc(stage=self.name)
+        raise Overloaded(self.name, self.retry_after())
+
+    @contextmanager
+    def slot(self, wait: bool = False):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                if not wait and self.waiting >= self.max_waiting:
+                    self._reject()
+                self.waiting += 1
+            waiting.inc(stage=self.name)
+            try:
+                acquired = self.slots.acquire(timeout=None if wait else QUEUE_TIMEOUT_SECONDS)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+                waiting.dec(stage=self.name)
+            if not acquired:
+                self._reject()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.perf_counter() - start)
+            self.slots.release()
+
+
+limiters = {
+    name: StageLimiter(
+        name,
+        int(os.getenv(f"ADMISSION_{name.upper()}_CONCURRENCY", conc)),
+        int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", queue)),
+    )
+    for name, (conc, queue) in DEFAULT_LIMITS.items()
+}
+
+
+def stage(name, wait: bool = False):
+    """
+    Holds a concurrency slot for the named stage, waiting in its bounded queue if needed.
+    With wait, never rejects: for work a response that has already started depends on,
+    whose callers are bounded by ingress admission instead.
+    """
+    return limiters[name].slot(wait)
+
+
+@asynccontextmanager
+async def stage_async(name):
+    """stage() for coroutines; the slot is waited for on a worker thread so the event loop keeps running."""
+    slot = stage(name)
+    entered = asyncio.ensure_future(asyncio.to_thread(slot.__enter__))
+    try:
+        await asyncio.shield(entered)
+    except asyncio.CancelledError:
+        # The thread may still get the slot after the caller has gone; give it straight back
+        entered.add_done_callback(lambda f: f.exception() is None and slot.__exit__(None, None, None))
+        raise
+    try:
+        yield
+    finally:
+        slot.__exit__(None, None, None)
+
+
+_admitted = 0
+_admitted_lock = threading.Lock()
+
+
+@contextmanager
+def admit(endpoint: str):
+    """Ingress check: rejects with 429 at once when too many requests are already admitted."""
+    global _admitted
+    with _admitted_lock:
+        if _admitted >= MAX_ADMITTED_REQUESTS:
+            rejected.inc(stage="ingress")
+            raise Overloaded(endpoint, max(l.retry_after() for l in limiters.values()), status_code=429)
+        _admitted += 1
+    try:
+        yield
+    finally:
+        with _admitted_lock:
+            _admitted -= 1
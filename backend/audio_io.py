@@ -0,0 +1,101 @@
+# audio_io.py
+import io
+import threading
+import av
+import numpy as np
+import librosa
+import soundfile
+
+
+class DecodedAudio:
+    """
+    Mono float32 samples in [-1, 1] and their sample rate.
+
+    Passed between pipeline stages instead of temp file paths so a request
+    is decoded once and never round-trips through disk. Resampled copies are
+    memoized, so stages asking for the same rate share one resample.
+    """
+
+    def __init__(self, samples, sample_rate: int):
+        self.samples = np.asarray(samples, dtype=np.float32)
+        self.sample_rate = int(sample_rate)
+        self._resampled = {self.sample_rate: self.samples}
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def resample(self, sample_rate: int):
+        """Returns the samples at the given rate; treat the result as read-only."""
+        with self._lock:
+            samples = self._resampled.get(sample_rate)
+            if samples is None:
+                samples = librosa.resample(self.samples, orig_sr=self.sample_rate, target_sr=sample_rate)
+                self._resampled[sample_rate] = samples
+            return samples
+
+
+def decode_bytes(data: bytes, filename: str = None) -> DecodedAudio:
+    """
+    Decodes an uploaded file from memory, in-process: libsndfile for
+    WAV/FLAC/Ogg, PyAV (the ffmpeg libraries) for everything else. No
+    ffmpeg subprocess is started.
+
+    Args:
+        data (bytes): Encoded audio (wav, m4a, mp3, ...).
+        filename (str): Optional original name, used in error messages.
+
+    Returns:
+        DecodedAudio: Mono samples at the file's native rate.
+    """
+    try:
+        samples, sample_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        return DecodedAudio(samples.mean(axis=1), sample_rate)
+    except soundfile.SoundFileError:
+        pass
+
+    try:
+        return _decode_av(data)
+    except (av.error.FFmpegError, IndexError) as e:
+        raise ValueError(f"Could not decode audio {filename or ''}: {e}") from e
+
+
+def _decode_av(data: bytes) -> DecodedAudio:
+    with av.open(io.BytesIO(data), mode="r") as container:
+        stream = container.streams.audio[0]
+        # Downmix to mono float32 at the native rate, as soundfile's branch does
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=stream.rate)
+        chunks = []
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    return DecodedAudio(samples, stream.rate)
+
+
+def probe_duration(data: bytes):
+    """
+    Reads an upload's duration from its container header without decoding it.
+
+    Returns:
+        float: Duration in seconds, or None if the header doesn't say.
+    """
+    try:
+        with av.open(io.BytesIO(data), mode="r") as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+            stream = container.streams.audio[0]
+            if stream.duration is not None:
+                return float(stream.duration * stream.time_base)
+    except (av.error.FFmpegError, IndexError):
+        pass
+    return None
+
+
+def load_audio(path: str, sample_rate: int = None) -> DecodedAudio:
+    """Loads an audio file from disk; kept for callers that still have paths."""
+    samples, sr = librosa.load(path, sr=sample_rate, mono=True)
+    return DecodedAudio(samples, sr)
@@ -0,0 +1,100 @@
+# batch.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from transcribe import transcribe_batch
+from rewrite import rewrite_text, RewriteError, REWRITE_MODEL, REWRITE_TEMPERATURE, PROMPT_VERSION
+from utils import log_interaction
+import metrics
+from cancel import checkpoint
+from audio_io import decode_bytes
+from pipeline import clean_for_tts
+from file_store import save_audio
+from voice_cloning import load_target_se, synthesize_cloned_batch, OUTPUT_SAMPLE_RATE
+
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "8"))  # clips per padded forward pass
+MAX_BATCH_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+REWRITE_CONCURRENCY = int(os.getenv("BATCH_REWRITE_CONCURRENCY", "8"))
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def process_batch(uploads, tone: str, user_id: str, output_format: str = "wav", output_rate: int = None,
+                  cancel=None, regenerate: bool = False) -> list:
+    """
+    Runs many clips for one user through the pipeline stage by stage:
+    padded Whisper batches, concurrent rewrites, then batched tone
+    conversion. Clips are sorted by length before batching so padding
+    stays small.
+
+    Blocking; call it from a worker thread.
+
+    Args:
+        uploads (list[tuple[bytes, str]]): (data, filename) per clip.
+        tone (str): Target tone value.
+        user_id (str): Owner of the cached speaker embedding.
+        output_format (str): Key of encoding.FORMATS for the result files.
+        output_rate (int): Optional sample rate of the result files.
+        cancel (CancelToken): Optional; checked between stages and chunks.
+        regenerate (bool): Ask the LLM even for texts with a cached rewrite.
+
+    Returns:
+        list[dict]: One result per upload, in input order. Clips without
+        speech, or whose rewrite failed, get an "error" entry instead of audio.
+    """
+    with metrics.stage("decode"):
+        decoded = [decode_bytes(data, filename) for data, filename in uploads]
+    audios = [audio.resample(16000) for audio in decoded]
+
+    originals = [None] * len(audios)
+    by_length = sorted(range(len(audios)), key=lambda i: len(audios[i]))
+    for chunk in _chunks(by_length, BATCH_SIZE):
+        for i, text in zip(chunk, transcribe_batch([audios[i] for i in chunk], cancel)):
+            originals[i] = text
+
+    spoken = [i for i, text in enumerate(originals) if text]
+    rewrites = [None] * len(audios)
+    errors = [None] * len(audios)
+
+    def rewrite(i):
+        # One clip's LLM failure shouldn't throw away the rest of the batch
+        try:
+            return rewrite_text(originals[i], tone, cancel, regenerate)
+        except RewriteError as e:
+            print(f"[ERROR] Batch rewrite of {uploads[i][1]} failed:", str(e))
+            errors[i] = "Rewrite failed, please try again"
+            return None
+
+    with ThreadPoolExecutor(max_workers=REWRITE_CONCURRENCY) as pool:
+        for i, text in zip(spoken, pool.map(rewrite, spoken)):
+            rewrites[i] = text
+
+    output_names = [None] * len(audios)
+    tts_texts = {i: clean_for_tts(rewrites[i]) for i in spoken if rewrites[i] is not None}
+    to_synthesize = sorted([i for i in tts_texts if tts_texts[i]], key=lambda i: len(tts_texts[i]))
+    if to_synthesize:
+        target_se = load_target_se(decoded[to_synthesize[0]], user_id)
+        for chunk in _chunks(to_synthesize, BATCH_SIZE):
+            cloned = synthesize_cloned_batch(target_se, [tts_texts[i] for i in chunk], cancel)
+            checkpoint(cancel, "file_write")
+            with metrics.stage("file_write"):
+                for i, audio in zip(chunk, cloned):
+                    output_names[i] = save_audio(audio, OUTPUT_SAMPLE_RATE, fmt=output_format, target_rate=output_rate)
+
+    results = []
+    for i, (_, filename) in enumerate(uploads):
+        if i not in to_synthesize:
+            results.append({"filename": filename, "original": originals[i], "error": errors[i] or "No speech detected"})
+            continue
+        log_interaction(tone, originals[i], rewrites[i], model=REWRITE_MODEL, temperature=REWRITE_TEMPERATURE,
+                        prompt_version=PROMPT_VERSION)
+        results.append({
+            "filename": filename,
+            "original": originals[i],
+            "rewritten": rewrites[i],
+            "audio_url": f"/files/{output_names[i]}"
+        })
+    return results
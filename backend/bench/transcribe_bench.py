@@ -0,0 +1,219 @@
+# bench/transcribe_bench.py
+"""
+Compares transcription engines on labelled clips: real-time factor
+(processing seconds / audio seconds, lower is faster), word error rate and
+resident memory. Each engine runs in a fresh process so its memory numbers
+are its own. "whisper:<size>:int8" is openai-whisper with dynamically
+quantized Linear layers (WHISPER_INT8=1); its WER drift and speedup versus
+"whisper:<size>" are reported when both are benchmarked.
+
+Clips are audio files with a same-named .txt reference next to them, or a
+JSONL manifest of {"audio": path, "text": reference} lines:
+
+    python -m bench.transcribe_bench --data clips/ \\
+        --engines whisper:tiny faster-whisper:tiny:int8 faster-whisper:base:int8 faster-whisper:small:int8
+
+    python -m bench.transcribe_bench --data clips/ --device cpu \
+        --engines whisper:tiny whisper:tiny:int8 whisper:base whisper:base:int8 whisper:small whisper:small:int8
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import torch # type: ignore
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from audio_io import load_audio
+from transcribe import run_whisper, run_faster_whisper
+from model_registry import quantize_whisper
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".m4a", ".ogg")
+SAMPLE_RATE = 16000
+
+
+def normalize(text: str) -> list:
+    text = re.sub(r"[^a-z0-9' ]+", " ", text.lower())
+    return text.split()
+
+
+def word_errors(reference: str, hypothesis: str):
+    """Word-level edit distance and reference length."""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1], len(ref)
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_clips(data: str) -> list:
+    """Returns [(name, samples at 16 kHz, reference text)]."""
+    entries = []
+    if os.path.isfile(data):
+        base = os.path.dirname(os.path.abspath(data))
+        with open(data) as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    entries.append((os.path.join(base, item["audio"]), item["text"]))
+    else:
+        for name in sorted(os.listdir(data)):
+            stem, ext = os.path.splitext(name)
+            ref_path = os.path.join(data, stem + ".txt")
+            if ext.lower() in AUDIO_EXTENSIONS and os.path.exists(ref_path):
+                with open(ref_path) as f:
+                    entries.append((os.path.join(data, name), f.read().strip()))
+    return [(os.path.basename(path), load_audio(path, SAMPLE_RATE).samples, text) for path, text in entries]
+
+
+def load_engine(spec: str, device: str, cpu_threads: int):
+    """
+    Args:
+        spec (str): "whisper:<size>[:int8]" or "faster-whisper:<size>[:<compute_type>]".
+
+    Returns:
+        tuple: (engine name, model)
+    """
+    parts = spec.split(":")
+    engine, size = parts[0], parts[1]
+    if engine == "whisper":
+        import whisper
+        model = whisper.load_model(size, device=device)
+        if len(parts) > 2 and parts[2] == "int8":
+            if device != "cpu":
+                raise ValueError("whisper int8 quantization is CPU only")
+            model = quantize_whisper(model)
+        return engine, model
+    if engine == "faster-whisper":
+        from faster_whisper import WhisperModel
+        compute_type = parts[2] if len(parts) > 2 else ("float16" if device == "cuda" else "int8")
+        return engine, WhisperModel(size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+    raise ValueError(f"Unknown engine in '{spec}'")
+
+
+def bench_engine(spec, clips, args) -> dict:
+    torch.set_num_threads(args.threads)
+    baseline_rss = rss_mb()
+    start = time.perf_counter()
+    engine, model = load_engine(spec, args.device, args.threads)
+    load_seconds = time.perf_counter() - start
+    model_rss = rss_mb() - baseline_rss
+
+    def run(audio):
+        if engine == "whisper":
+            return run_whisper(model, audio)
+        return run_faster_whisper(model, audio, beam_size=args.beam_size, vad_filter=args.vad_filter)
+
+    # One warm-up pass so lazy initialisation isn't billed to the first clip
+    run(clips[0][1])
+
+    files, errors, words, busy, audio_seconds = [], 0, 0, 0.0, 0.0
+    for name, audio, reference in clips:
+        start = time.perf_counter()
+        hypothesis = run(audio)
+        elapsed = time.perf_counter() - start
+        edits, length = word_errors(reference, hypothesis)
+        duration = len(audio) / SAMPLE_RATE
+
+        errors, words, busy, audio_seconds = errors + edits, words + length, busy + elapsed, audio_seconds + duration
+        files.append({
+            "name": name,
+            "duration": round(duration, 2),
+            "seconds": round(elapsed, 3),
+            "rtf": round(elapsed / duration, 4),
+            "wer": round(edits / max(length, 1), 4),
+            "hypothesis": hypothesis,
+        })
+
+    return {
+        "engine": spec,
+        "load_seconds": round(load_seconds, 2),
+        "model_rss_mb": round(model_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "audio_seconds": round(audio_seconds, 2),
+        "processing_seconds": round(busy, 3),
+        "rtf": round(busy / audio_seconds, 4),
+        "wer": round(errors / max(words, 1), 4),
+        "files": files,
+    }
+
+
+def compare_to_fp32(results):
+    """Adds WER drift and speedup of each "whisper:<size>:int8" run against "whisper:<size>"."""
+    by_spec = {r["engine"]: r for r in results}
+    for r in results:
+        parts = r["engine"].split(":")
+        base = by_spec.get(":".join(parts[:2]))
+        if parts[0] != "whisper" or parts[2:] != ["int8"] or base is None:
+            continue
+        r["vs_fp32"] = {
+            "wer_drift": round(r["wer"] - base["wer"], 4),
+            "rtf_speedup": round(base["rtf"] / max(r["rtf"], 1e-9), 2),
+            "rss_ratio": round(r["model_rss_mb"] / max(base["model_rss_mb"], 1e-9), 2),
+            "changed_transcripts": sum(a["hypothesis"] != b["hypothesis"] for a, b in zip(r["files"], base["files"])),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", required=True, help="directory of audio + .txt pairs, or a JSONL manifest")
+    parser.add_argument("--engines", nargs="+", default=["whisper:tiny", "faster-whisper:tiny:int8", "faster-whisper:base:int8"])
+    parser.add_argument("--beam-size", type=int, default=1)
+    parser.add_argument("--vad-filter", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="CPU threads for both engines")
+    parser.add_argument("--output", help="write the full results as JSON here")
+    args = parser.parse_args()
+
+    clips = load_clips(args.data)
+    if not clips:
+        sys.exit(f"[ERROR] No labelled clips found in {args.data}")
+    print(f"[INFO] {len(clips)} clip(s), {sum(len(a) for _, a, _ in clips) / SAMPLE_RATE:.1f}s of audio")
+
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for spec in args.engines:
+        print(f"[INFO] Benchmarking {spec} ...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            results.append(pool.submit(bench_engine, spec, clips, args).result())
+    compare_to_fp32(results)
+
+    print(f"\n{'engine':<30} {'load s':>8} {'RTF':>8} {'WER':>8} {'model MB':>9} {'peak MB':>9} {'WER drift':>10} {'speedup':>8}")
+    for r in results:
+        line = (f"{r['engine']:<30} {r['load_seconds']:>8.2f} {r['rtf']:>8.4f} {r['wer']:>8.2%} "
+                f"{r['model_rss_mb']:>9.1f} {r['peak_rss_mb']:>9.1f}")
+        if "vs_fp32" in r:
+            line += f" {r['vs_fp32']['wer_drift']:>+10.2%} {r['vs_fp32']['rtf_speedup']:>7.2f}x"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"[INFO] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# cache.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache bounded by entry count and age.
+
+    Least recently used entries are evicted once max_entries is reached;
+    entries older than ttl_seconds are dropped when they are looked up.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, validate=None):
+        """Returns the cached value, or None. Values failing validate(value) are evicted as misses."""
+        with self.lock:
+            entry = self.entries.get(key)
+            expired = entry is not None and self.ttl_seconds is not None and time.time() - entry[0] > self.ttl_seconds
+            if expired or (entry is not None and validate is not None and not validate(entry[1])):
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, created: float = None):
+        """Stores value; created backdates it (a Unix time) for the TTL."""
+        with self.lock:
+            self.entries[key] = (created or time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+    """
+    On-disk store for JSON-serialisable values, shared by every worker
+    process using the same file and kept across restarts. Bounded by entry
+    count (least recently read go first) and age. Storage errors are logged
+    and treated as misses so a bad disk never fails a request.
+    """
+
+    PRUNE_EVERY = 100  # puts between size checks
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        # Opened lazily, and again after a fork, so processes never share a connection
+        if self.conn is None or self.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self.conn.commit()
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self.lock:
+                conn = self._connect()
+                row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    conn.commit()
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"[ERROR] Cache read from {self.path} failed:", str(e))
+            return None
+
+    def put(self, key, value, created: float = None):
+        now = time.time()
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), created or now, now),
+                )
+                self.puts += 1
+                if self.puts % self.PRUNE_EVERY == 0:
+                    self._prune(conn, now)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Cache write to {self.path} failed:", str(e))
+
+    def _prune(self, conn, now):
+        if self.ttl_seconds is not None:
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> dict:
+        try:
+            with self.lock:
+                entries = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            entries = 0
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+class TieredCache:
+    """An LRUCache in front of a SQLiteCache; disk hits are copied into memory."""
+
+    def __init__(self, memory: LRUCache, disk: SQLiteCache = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key, value, created: float = None):
+        self.memory.put(key, value, created)
+        if self.disk is not None:
+            self.disk.put(key, value, created)
+
+    def stats(self) -> dict:
+        """Memory entries; a hit is a value from either tier, a miss is neither."""
+        memory = self.memory.stats()
+        disk = self.disk.stats() if self.disk is not None else {"hits": 0, "misses": memory["misses"]}
+        return {"entries": memory["entries"], "hits": memory["hits"] + disk["hits"], "misses": disk["misses"]}
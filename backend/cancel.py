@@ -0,0 +1,86 @@
+# cancel.py
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import metrics
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+cancelled_total = metrics.Counter(
+    "voicemask_cancelled_total", "Pipeline runs abandoned because the client went away, by stage reached.", ["stage"]
+)
+
+
+class Cancelled(Exception):
+    """Raised at a checkpoint once the request's client has gone away."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request cancelled before {stage}")
+        self.stage = stage
+
+
+class CancelToken:
+    """
+    Set from the event loop when a client disconnects and checked by the
+    worker thread between stages, so abandoned work stops at the next
+    checkpoint instead of running to completion.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """Calls callback() on cancel, or right away if already cancelled."""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def check(self, stage: str):
+        if self.event.is_set():
+            cancelled_total.inc(stage=stage)
+            raise Cancelled(stage)
+
+
+def checkpoint(token, stage: str):
+    """Raises Cancelled if token (which may be None) has been cancelled."""
+    if token is not None:
+        token.check(stage)
+
+
+async def watch_disconnect(request, token: CancelToken):
+    """Cancels token once request's client disconnects; run as a task alongside the work."""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            print("[INFO] Client disconnected; cancelling request")
+            token.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(request):
+    """Yields a CancelToken that is cancelled if request's client disconnects inside the block."""
+    token = CancelToken()
+    watcher = asyncio.create_task(watch_disconnect(request, token))
+    try:
+        yield token
+    finally:
+        watcher.cancel()
@@ -0,0 +1,124 @@
+# encoding.py
+import io
+import av
+import numpy as np
+import librosa
+import soundfile
+
+# Output formats: PyAV container/codec, file extension, MIME type and bit rate
+FORMATS = {
+    "wav": {"container": None, "codec": None, "ext": "wav", "media_type": "audio/wav", "bit_rate": None},
+    "opus": {"container": "ogg", "codec": "libopus", "ext": "ogg", "media_type": "audio/ogg", "bit_rate": 32000},
+    "webm": {"container": "webm", "codec": "libopus", "ext": "webm", "media_type": "audio/webm", "bit_rate": 32000},
+    "aac": {"container": "mp4", "codec": "aac", "ext": "m4a", "media_type": "audio/mp4", "bit_rate": 64000},
+    "mp3": {"container": "mp3", "codec": "libmp3lame", "ext": "mp3", "media_type": "audio/mpeg", "bit_rate": 64000},
+}
+DEFAULT_FORMAT = "wav"
+
+# Sample rates libopus accepts; other requests are rounded up to the next one
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+# Output sample_rate values a client may ask for
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+
+ACCEPT_TYPES = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/webm": "webm",
+    "audio/mp4": "aac",
+    "audio/m4a": "aac",
+    "audio/x-m4a": "aac",
+    "audio/aac": "aac",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+}
+
+
+def negotiate(format_field: str = None, accept: str = None) -> str:
+    """
+    Picks the output format: an explicit form field wins, then the highest
+    quality audio type in the Accept header, then DEFAULT_FORMAT.
+
+    Raises:
+        ValueError: If format_field names an unsupported format.
+    """
+    if format_field:
+        if format_field.lower() not in FORMATS:
+            raise ValueError(f"Unsupported format '{format_field}', expected one of {sorted(FORMATS)}")
+        return format_field.lower()
+
+    best, best_q = DEFAULT_FORMAT, 0.0
+    for part in (accept or "").split(","):
+        pieces = [p.strip() for p in part.split(";")]
+        fmt = ACCEPT_TYPES.get(pieces[0].lower())
+        if fmt is None:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def check_sample_rate(sample_rate: int = None):
+    """
+    Raises:
+        ValueError: If an output sample_rate was given outside MIN_SAMPLE_RATE..MAX_SAMPLE_RATE.
+    """
+    if sample_rate is not None and not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"sample_rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE} Hz")
+
+
+def _output_rate(fmt: str, sample_rate: int, target_rate: int = None) -> int:
+    rate = target_rate or sample_rate
+    if FORMATS[fmt]["codec"] == "libopus":
+        rate = next((r for r in OPUS_SAMPLE_RATES if r >= rate), OPUS_SAMPLE_RATES[-1])
+    return rate
+
+
+def encode(audio, sample_rate: int, fmt: str = DEFAULT_FORMAT, target_rate: int = None) -> bytes:
+    """
+    Encodes mono float32 audio in memory.
+
+    Args:
+        audio (np.ndarray): Samples in [-1, 1].
+        sample_rate (int): Rate of audio.
+        fmt (str): Key of FORMATS.
+        target_rate (int): Optional output rate; resampled before encoding.
+
+    Returns:
+        bytes: The encoded file.
+    """
+    spec = FORMATS[fmt]
+    rate = _output_rate(fmt, sample_rate, target_rate)
+    audio = np.asarray(audio, dtype=np.float32)
+    if rate != sample_rate:
+        audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=rate)
+    audio = np.clip(audio, -1.0, 1.0)
+
+    buffer = io.BytesIO()
+    if spec["container"] is None:
+        soundfile.write(buffer, audio, rate, format="WAV")
+        return buffer.getvalue()
+
+    with av.open(buffer, mode="w", format=spec["container"]) as container:
+        stream = container.add_stream(spec["codec"], rate=rate)
+        stream.bit_rate = spec["bit_rate"]
+        stream.layout = "mono"
+
+        frame = av.AudioFrame.from_ndarray(audio.reshape(1, -1), format="flt", layout="mono")
+        frame.sample_rate = rate
+        # PyAV converts the sample format and re-frames to the codec's frame size
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
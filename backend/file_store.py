@@ -0,0 +1,197 @@
+# file_store.py
+import os
+import re
+import time
+import hashlib
+import threading
+from fastapi import Request, HTTPException
+from fastapi.responses import FileResponse, Response
+
+import encoding
+
+AUDIO_DIR = "audio"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PREVIEWS_DIR = os.path.join(BASE_DIR, "audio_cache", "previews")
+PROCESSED_DIR = "processed"  # se_extractor's default target_dir
+
+# Directories the reaper keeps under budget
+REAPED_DIRS = [AUDIO_DIR, PREVIEWS_DIR, PROCESSED_DIR]
+MAX_FILE_AGE_SECONDS = int(os.getenv("FILE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+DISK_BUDGET_BYTES = int(os.getenv("FILE_DISK_BUDGET_MB", "2048")) * 1024 * 1024
+REAPER_INTERVAL_SECONDS = int(os.getenv("FILE_REAPER_INTERVAL_SECONDS", "600"))
+
+# Names like rewritten_<32 hex chars>.wav never change content once written
+HASHED_NAME = re.compile(r"^[a-z]+_([0-9a-f]{32})\.[a-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MEDIA_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
+    "mp4": "audio/mp4",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+    "webm": "audio/webm"
+}
+
+
+def save_audio(audio, sample_rate: int, prefix: str = "rewritten", fmt: str = encoding.DEFAULT_FORMAT, target_rate: int = None) -> str:
+    """
+    Encodes audio (see encoding.FORMATS) and writes it under AUDIO_DIR with
+    a content-hash name.
+
+    Returns:
+        str: The file name, e.g. "rewritten_<hash>.ogg". Identical output
+        maps to the same name, so it is written only once; reusing it
+        refreshes its mtime.
+    """
+    data = encoding.encode(audio, sample_rate, fmt, target_rate)
+    ext = encoding.FORMATS[fmt]["ext"]
+
+    name = f"{prefix}_{hashlib.sha256(data).hexdigest()[:32]}.{ext}"
+    path = os.path.join(AUDIO_DIR, name)
+    try:
+        # The reaper deletes by mtime, so a reused file must look as new as the URL handed out for it
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(AUDIO_DIR, exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    return name
+
+
+def resolve(directory: str, name: str) -> str:
+    """Joins name onto directory, refusing anything that escapes it."""
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep):
+        raise HTTPException(status_code=404, detail="File not found")
+    return path
+
+
+def _parse_range(header: str, size: int):
+    """
+    Parses a single "bytes=start-end" range.
+
+    Returns:
+        tuple: (start, end) inclusive, or None when the header is malformed
+        or asks for several ranges; per RFC 9110 it is then ignored and the
+        whole file sent.
+
+    Raises:
+        ValueError: If the range is well formed but lies past the end of the file.
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)-(\d*)\s*", header)
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.group(1), match.group(2)
+    if start == "":
+        length = int(end)
+        if length == 0 or size == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError("range starts past the end of the file")
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+def file_response(request: Request, path: str) -> Response:
+    """
+    Serves a file with ETag/If-None-Match revalidation and single byte-range
+    support. Content-hash names get a strong ETag and an immutable
+    Cache-Control header.
+    """
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    name = os.path.basename(path)
+    media_type = MEDIA_TYPES.get(name.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+    stat = os.stat(path)
+    hashed = HASHED_NAME.match(name)
+
+    if hashed:
+        etag = f'"{hashed.group(1)}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{int(stat.st_mtime_ns)}-{stat.st_size}"'
+        cache_control = "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return Response(status_code=416, headers=headers)
+
+        if byte_range is not None:
+            start, end = byte_range
+            with open(path, "rb") as f:
+                f.seek(start)
+                content = f.read(end - start + 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            return Response(content=content, status_code=206, media_type=media_type, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def reap_once(now: float = None) -> int:
+    """
+    Deletes files older than MAX_FILE_AGE_SECONDS from REAPED_DIRS, then the
+    oldest remaining files until they fit in DISK_BUDGET_BYTES.
+
+    Returns:
+        int: Number of files deleted.
+    """
+    now = now or time.time()
+    files = []
+    for directory in REAPED_DIRS:
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    deleted = 0
+    for mtime, size, path in files:
+        if now - mtime <= MAX_FILE_AGE_SECONDS and total <= DISK_BUDGET_BYTES:
+            break
+        try:
+            os.remove(path)
+            deleted += 1
+        except OSError:
+            pass
+        total -= size
+
+    if deleted:
+        print(f"[INFO] Reaper removed {deleted} file(s); {total / (1024 * 1024):.1f} MiB remain")
+    return deleted
+
+
+def start_reaper():
+    def loop():
+        while True:
+            try:
+                reap_once()
+            except Exception as e:
+                print("[ERROR] Reaper failed:", str(e))
+            time.sleep(REAPER_INTERVAL_SECONDS)
+
+    threading.Thread(target=loop, name="file-reaper", daemon=True).start()
@@ -0,0 +1,246 @@
+# jobs.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+
+import metrics
+import encoding
+from pipeline import ToneEnum, STAGES, process_upload
+
+router = APIRouter()
+
+MAX_PENDING_JOBS = int(os.getenv("JOB_MAX_PENDING", "32"))  # queued + running
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))  # how long finished jobs stay pollable
+JOB_RETRY_AFTER_SECONDS = 5
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Shared by every serve.py worker, so a job can be polled through whichever worker answers
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(BASE_DIR, "cache", "jobs.sqlite3"))
+
+
+class JobStore:
+    """
+    Job records in a SQLite file shared by all worker processes. Each job is
+    only updated by the process running it; reads may come from any process.
+    Each row records its owner process as pid plus start time, so a pid
+    reused after a restart isn't mistaken for the process that queued the
+    job. Jobs whose owner is gone are marked failed on the next prune.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.owner = None
+
+    def _connect(self):
+        # Opened lazily, and again after a fork, so processes never share a connection
+        if self.conn is None or self.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, owner TEXT NOT NULL, "
+                "finished_at REAL, record TEXT NOT NULL)"
+            )
+            self.pid = os.getpid()
+            self.owner = _process_owner(self.pid)
+        return self.conn
+
+    def create(self, job: dict, max_pending: int) -> bool:
+        """Inserts job unless max_pending jobs are already queued or running; returns whether it did."""
+        with self.lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")  # count and insert atomically across processes
+            try:
+                pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+                if pending >= max_pending:
+                    return False
+                conn.execute(
+                    "INSERT INTO jobs (id, status, owner, finished_at, record) VALUES (?, ?, ?, ?, ?)",
+                    (job["id"], job["status"], self.owner, job["finished_at"], json.dumps(job)),
+                )
+                return True
+            finally:
+                conn.execute("COMMIT")
+
+    def get(self, job_id: str):
+        with self.lock:
+            row = self._connect().execute("SELECT record FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id: str, change):
+        """Applies change(job) to the stored record."""
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute("SELECT record FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            change(job)
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, record = ? WHERE id = ?",
+                (job["status"], job["finished_at"], json.dumps(job), job_id),
+            )
+
+    def count(self, status: str) -> int:
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def prune(self, ttl_seconds: float):
+        """Drops jobs finished more than ttl_seconds ago and fails unfinished ones whose worker is gone."""
+        with self.lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - ttl_seconds,))
+            unfinished = conn.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        for job_id, owner in unfinished:
+            if owner != self.owner and _process_owner(int(owner.split(":")[0])) != owner:
+                self.update(job_id, _mark_orphaned)
+
+
+def _process_owner(pid: int):
+    """Returns "<pid>:<start time>" for a running process, or None if it has exited."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except FileNotFoundError:
+        if os.path.isdir("/proc"):
+            return None
+        # No procfs: fall back to the pid alone, which can't tell a reused pid apart
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+        return str(pid)
+    # Fields after the parenthesized command name; starttime is field 22 of stat
+    return f"{pid}:{stat.rsplit(')', 1)[1].split()[19]}"
+
+
+def _mark_orphaned(job):
+    job["status"] = "failed"
+    job["error"] = "Worker exited before the job finished"
+    job["finished_at"] = time.time()
+
+
+job_store = JobStore(JOBS_DB_PATH)
+metrics.Gauge("voicemask_job_queue_depth", "Jobs waiting for a worker, across all workers.",
+              function=lambda: job_store.count("queued"))
+
+
+def _run_job(job_id, data, filename, tone, user_id, output_format, output_rate, regenerate=False):
+    def on_stage(stage, status):
+        def change(job):
+            # Queued until the scheduler starts the run, or another run answers it
+            if job["status"] == "queued":
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            entry = job["stages"][stage]
+            entry["status"] = status
+            if status == "running":
+                entry["started_at"] = time.time()
+            elif status == "cached":
+                entry["seconds"] = 0
+            else:
+                entry["seconds"] = round(time.time() - entry["started_at"], 3)
+        job_store.update(job_id, change)
+
+    try:
+        with metrics.request("jobs"):
+            result = process_upload(data, filename, tone, user_id, on_stage=on_stage,
+                                        output_format=output_format, output_rate=output_rate, priority="batch",
+                                        regenerate=regenerate)
+        outcome = {"status": "done", "result": result}
+    except Exception as e:
+        print(f"[ERROR] Job {job_id} failed:", str(e))
+        outcome = {"status": "failed", "error": str(e)}
+
+    def finish(job):
+        job.update(outcome)
+        job["finished_at"] = time.time()
+    job_store.update(job_id, finish)
+
+
+@router.post("")
+async def submit_job(
+    request: Request,
+    file: UploadFile = File(...),
+    tone: ToneEnum = Form(...),
+    user_id: str = Form(...),
+    format: Optional[str] = Form(None),
+    sample_rate: Optional[int] = Form(None),
+    regenerate: bool = Form(False)
+):
+    try:
+        encoding.check_sample_rate(sample_rate)
+        output_format = encoding.negotiate(format, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with metrics.stage("upload"):
+        data = await file.read()
+
+    job_id = str(uuid.uuid4())
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "tone": tone.value,
+        "user_id": user_id,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "stages": {stage: {"status": "pending", "started_at": None, "seconds": None} for stage in STAGES},
+        "result": None,
+        "error": None,
+    }
+    job_store.prune(JOB_TTL_SECONDS)
+    if not job_store.create(job, MAX_PENDING_JOBS):
+        raise HTTPException(status_code=429, detail="Too many pending jobs, retry later", headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)})
+
+    # Jobs are polled rather than awaited, so their pipeline runs queue behind interactive work.
+    # The job waits on its own thread, not a scheduler worker, so joining an identical
+    # run that is still queued can't tie up the workers that run would need.
+    threading.Thread(target=_run_job, name=f"job-{job_id[:8]}", daemon=True,
+                     args=(job_id, data, file.filename, tone.value, user_id, output_format, sample_rate, regenerate)).start()
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "tone": job["tone"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "progress": {
+            stage: {"status": s["status"], "seconds": s["seconds"]}
+            for stage, s in job["stages"].items()
+        },
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job["result"]
@@ -0,0 +1,81 @@
+# loadtest/corpus.py
+"""
+Synthetic speech-like clips of varied length for load tests: a gliding
+harmonic "voice" chopped into syllables at ~4 Hz, with pauses and a little
+noise, so VAD, Whisper and the converter all do a realistic amount of work.
+
+    python -m loadtest.corpus --out loadtest/corpus --durations 2 5 10 20 45
+"""
+import io
+import os
+import argparse
+import numpy as np
+import soundfile
+
+DEFAULT_DURATIONS = (2, 3, 5, 8, 12, 20, 30, 45)
+SAMPLE_RATE = 16000
+
+
+def synth_clip(duration: float, sample_rate: int = SAMPLE_RATE, seed: int = 0) -> np.ndarray:
+    """Mono float32 speech-like audio of the given duration."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sample_rate)
+    t = np.arange(n) / sample_rate
+
+    # Pitch wanders around a speaker-specific base between 100 and 220 Hz
+    base = rng.uniform(100, 220)
+    pitch = base * (1 + 0.15 * np.sin(2 * np.pi * rng.uniform(0.2, 0.6) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+
+    # Syllable envelope with occasional pauses between "words"
+    syllables = 0.5 * (1 - np.cos(2 * np.pi * rng.uniform(3.5, 5.0) * t))
+    words = (np.sin(2 * np.pi * rng.uniform(0.3, 0.7) * t + rng.uniform(0, np.pi)) > -0.6).astype(np.float32)
+    audio = voice * syllables * words + 0.01 * rng.standard_normal(n)
+    return (0.3 * audio / np.max(np.abs(audio))).astype(np.float32)
+
+
+def to_wav_bytes(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    soundfile.write(buffer, audio, sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def build_corpus(durations=DEFAULT_DURATIONS, seed: int = 0) -> list:
+    """
+    Returns:
+        list[tuple[str, float, bytes]]: (name, duration, WAV bytes) per clip.
+    """
+    return [
+        (f"clip_{i:02d}_{duration:g}s.wav", float(duration), to_wav_bytes(synth_clip(duration, seed=seed + i)))
+        for i, duration in enumerate(durations)
+    ]
+
+
+def load_corpus(directory: str) -> list:
+    """Reads every .wav in directory as (name, duration, bytes)."""
+    clips = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".wav"):
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                clips.append((name, soundfile.info(path).duration, f.read()))
+    return clips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--durations", type=float, nargs="+", default=list(DEFAULT_DURATIONS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, _, data in build_corpus(args.durations, args.seed):
+        with open(os.path.join(args.out, name), "wb") as f:
+            f.write(data)
+    print(f"[INFO] Wrote {len(args.durations)} clip(s) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# loadtest/fake_checkpoints.py
+"""
+Random-weight checkpoints with the real architectures, built from the
+released config.json files, so the full pipeline runs (and costs about as
+much compute) without downloading the trained weights. Output audio is noise.
+
+    python -m loadtest.fake_checkpoints --converter-config checkpoints/converter/config.json \\
+        --out loadtest/checkpoints
+    # then run the app with CHECKPOINTS_DIR=loadtest/checkpoints
+"""
+import os
+import sys
+import shutil
+import argparse
+import torch # type: ignore
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from openvoice.models import SynthesizerTrn
+from openvoice.utils import get_hparams_from_file
+
+
+def make_converter_checkpoint(config_path: str, out_dir: str, seed: int = 0) -> str:
+    """
+    Writes <out_dir>/converter/{config.json,checkpoint.pth}; laid out like
+    model_registry.CHECKPOINTS_DIR.
+
+    Returns:
+        str: Path of the checkpoint.
+    """
+    torch.manual_seed(seed)
+    hps = get_hparams_from_file(config_path)
+    # Same construction as openvoice.api.OpenVoiceBaseClass
+    model = SynthesizerTrn(
+        len(getattr(hps, "symbols", [])),
+        hps.data.filter_length // 2 + 1,
+        n_speakers=hps.data.n_speakers,
+        **hps.model,
+    )
+
+    target_dir = os.path.join(out_dir, "converter")
+    os.makedirs(target_dir, exist_ok=True)
+    if os.path.abspath(config_path) != os.path.abspath(os.path.join(target_dir, "config.json")):
+        shutil.copyfile(config_path, os.path.join(target_dir, "config.json"))
+    ckpt_path = os.path.join(target_dir, "checkpoint.pth")
+    torch.save({"model": model.state_dict()}, ckpt_path)
+    print(f"[INFO] Wrote random converter weights to {ckpt_path}")
+    return ckpt_path
+
+
+def make_melo_checkpoint(config_path: str, out_dir: str, seed: int = 0) -> str:
+    """
+    Writes <out_dir>/base_speakers/EN/{config.json,checkpoint.pth} for the
+    MeloTTS base speaker; point MELO_CONFIG/MELO_CKPT at them.
+
+    Returns:
+        str: Path of the checkpoint.
+    """
+    from melo.models import SynthesizerTrn as MeloSynthesizerTrn # type: ignore
+    from melo.utils import get_hparams_from_file as melo_hparams # type: ignore
+
+    torch.manual_seed(seed)
+    hps = melo_hparams(config_path)
+    # Same construction as melo.api.TTS
+    model = MeloSynthesizerTrn(
+        len(hps.symbols),
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        n_speakers=hps.data.n_speakers,
+        num_tones=hps.num_tones,
+        num_languages=hps.num_languages,
+        **hps.model,
+    )
+
+    target_dir = os.path.join(out_dir, "base_speakers", "EN")
+    os.makedirs(target_dir, exist_ok=True)
+    if os.path.abspath(config_path) != os.path.abspath(os.path.join(target_dir, "config.json")):
+        shutil.copyfile(config_path, os.path.join(target_dir, "config.json"))
+    ckpt_path = os.path.join(target_dir, "checkpoint.pth")
+    torch.save({"model": model.state_dict()}, ckpt_path)
+    print(f"[INFO] Wrote random MeloTTS weights to {ckpt_path}")
+    return ckpt_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--converter-config", required=True, help="converter config.json from the release")
+    parser.add_argument("--melo-config", help="optional MeloTTS EN config.json")
+    parser.add_argument("--out", default=os.path.join(BACKEND_DIR, "loadtest", "checkpoints"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    make_converter_checkpoint(args.converter_config, args.out, args.seed)
+    if args.melo_config:
+        make_melo_checkpoint(args.melo_config, args.out, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# loadtest/run.py
+"""
+End-to-end load test of POST /process/.
+
+By default it starts an OpenAI stub (stub_openai.py), writes random-weight
+converter checkpoints (fake_checkpoints.py), boots the app with both, and
+sends the synthetic corpus (corpus.py) at each --concurrency level. Clips
+get a random dither per request so the result and transcript caches never
+answer them. Dithering doesn't change the transcript, so requests also ask
+to regenerate the rewrite, and the booted app runs without a rewrite cache
+file or history pre-warm; every rewrite then waits on the stub.
+It writes a JSON report with throughput, latency percentiles and the
+per-stage breakdown scraped from /metrics:
+
+    python -m loadtest.run --converter-config checkpoints/converter/config.json \\
+        --concurrency 1 4 8 --requests 40 --output loadtest/results/run.json
+
+Whisper and MeloTTS (and its BERT) still load from their local caches, so
+fetch them once while online. Use --url to test a server that is already running.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from loadtest.stub_openai import StubOpenAI
+from loadtest.corpus import build_corpus, load_corpus, DEFAULT_DURATIONS
+from loadtest.fake_checkpoints import make_converter_checkpoint, make_melo_checkpoint
+
+USER_ID = "loadtest-user"
+SAMPLE_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$")
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def percentile(values, q: float):
+    """Linear-interpolated percentile of values (q in 0..100); None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(values) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def parse_histograms(text: str, name: str, label: str) -> dict:
+    """
+    Reads one histogram family from Prometheus text.
+
+    Returns:
+        dict: label value -> {"buckets": [(le, count)], "sum": s, "count": n}.
+    """
+    series = {}
+    for line in text.splitlines():
+        match = SAMPLE_LINE.match(line)
+        if not match or not match.group(1).startswith(name):
+            continue
+        metric, labels, value = match.group(1), dict(LABEL.findall(match.group(2) or "")), float(match.group(3))
+        entry = series.setdefault(labels.get(label, ""), {"buckets": [], "sum": 0.0, "count": 0.0})
+        if metric == f"{name}_bucket":
+            entry["buckets"].append((float(labels["le"].replace("+Inf", "inf")), value))
+        elif metric == f"{name}_sum":
+            entry["sum"] = value
+        elif metric == f"{name}_count":
+            entry["count"] = value
+    return series
+
+
+def histogram_delta(before: dict, after: dict) -> dict:
+    delta = {}
+    for key, end in after.items():
+        start = before.get(key, {"buckets": [], "sum": 0.0, "count": 0.0})
+        start_buckets = dict(start["buckets"])
+        delta[key] = {
+            "buckets": [(le, count - start_buckets.get(le, 0.0)) for le, count in end["buckets"]],
+            "sum": end["sum"] - start["sum"],
+            "count": end["count"] - start["count"],
+        }
+    return delta
+
+
+def bucket_quantile(buckets, q: float):
+    """Prometheus-style histogram_quantile over cumulative (le, count) buckets."""
+    total = buckets[-1][1] if buckets else 0
+    if total <= 0:
+        return None
+    rank = q * total
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if le == float("inf"):
+                return prev_le
+            return prev_le + (le - prev_le) * (rank - prev_count) / max(count - prev_count, 1e-9)
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def breakdown(before_text: str, after_text: str, name: str, label: str) -> dict:
+    result = {}
+    delta = histogram_delta(parse_histograms(before_text, name, label), parse_histograms(after_text, name, label))
+    for key, h in sorted(delta.items()):
+        if h["count"] <= 0:
+            continue
+        p50, p95 = bucket_quantile(h["buckets"], 0.5), bucket_quantile(h["buckets"], 0.95)
+        result[key] = {
+            "count": int(h["count"]),
+            "mean": round(h["sum"] / h["count"], 4),
+            "total_seconds": round(h["sum"], 3),
+            "p50": round(p50, 4) if p50 is not None else None,
+            "p95": round(p95, 4) if p95 is not None else None,
+        }
+    return result
+
+
+def dithered(data: bytes) -> bytes:
+    """Flips the last PCM sample's low bits so every upload hashes differently."""
+    out = bytearray(data)
+    out[-2:] = random.getrandbits(16).to_bytes(2, "little")
+    return bytes(out)
+
+
+async def run_level(client, url, corpus, concurrency, total, args) -> dict:
+    latencies, statuses, by_clip, audio_seconds = [], {}, {}, 0.0
+    issued = 0
+
+    async def worker():
+        nonlocal issued, audio_seconds
+        while issued < total:
+            issued += 1
+            name, duration, data = random.choice(corpus)
+            payload = data if args.allow_cache_hits else dithered(data)
+            form = {"tone": args.tone, "user_id": USER_ID}
+            if not args.allow_cache_hits:
+                form["regenerate"] = "true"
+            if args.format:
+                form["format"] = args.format
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/process/", data=form, files={"file": (name, payload, "audio/wav")})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+                by_clip.setdefault(name, []).append(elapsed)
+                audio_seconds += duration
+
+    metrics_before = (await client.get(f"{url}/metrics")).text
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    metrics_after = (await client.get(f"{url}/metrics")).text
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": total - len(latencies),
+        "status_counts": statuses,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 4) if wall else None,
+        "audio_seconds_per_second": round(audio_seconds / wall, 4) if wall else None,
+        "latency": summarize(latencies),
+        "latency_by_clip": {name: summarize(values) for name, values in sorted(by_clip.items())},
+        "stages": breakdown(metrics_before, metrics_after, "voicemask_stage_seconds", "stage"),
+        "scheduler_wait": breakdown(metrics_before, metrics_after, "voicemask_scheduler_wait_seconds", "priority"),
+    }
+
+
+def boot_app(args, stub) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "openai_key": "stub",
+        "openai_base_url": stub.base_url,
+        "WATERMARK_ENABLED": "1" if args.watermark else "0",
+    })
+    if not args.allow_cache_hits:
+        env.update({"REWRITE_CACHE_PATH": "", "REWRITE_CACHE_PREWARM": "0"})
+    if args.converter_config:
+        make_converter_checkpoint(args.converter_config, args.checkpoints_dir)
+        env["CHECKPOINTS_DIR"] = args.checkpoints_dir
+    if args.melo_config:
+        ckpt = make_melo_checkpoint(args.melo_config, args.checkpoints_dir)
+        env["MELO_CONFIG"] = os.path.join(os.path.dirname(ckpt), "config.json")
+        env["MELO_CKPT"] = ckpt
+
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port)]
+    print(f"[INFO] Starting app: {' '.join(command)}")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+
+async def wait_ready(client, url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if (await client.get(f"{url}/healthz")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1)
+    raise RuntimeError(f"App at {url} not ready after {timeout}s")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def main_async(args):
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus(args.durations, args.seed)
+    random.seed(args.seed)
+
+    stub = app = None
+    url = args.url
+    if url is None:
+        stub = StubOpenAI(latency_ms=args.openai_latency_ms, jitter_ms=args.openai_jitter_ms).start()
+        print(f"[INFO] Stub OpenAI at {stub.base_url}")
+        app = boot_app(args, stub)
+        url = f"http://127.0.0.1:{args.port}"
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "url": url,
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "corpus": [{"name": name, "duration": round(duration, 2), "bytes": len(data)} for name, duration, data in corpus],
+        "levels": [],
+    }
+
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout) as client:
+            await wait_ready(client, url, args.startup_timeout)
+            if args.warmup:
+                # First request per user also extracts and caches the speaker embedding
+                print(f"[INFO] Warming up with {args.warmup} request(s)")
+                await run_level(client, url, corpus, 1, args.warmup, args)
+
+            for concurrency in args.concurrency:
+                print(f"[INFO] Concurrency {concurrency}: {args.requests} request(s)")
+                level = await run_level(client, url, corpus, concurrency, args.requests, args)
+                print(f"[INFO]   {level['throughput_rps']} req/s, latency {level['latency']}")
+                report["levels"].append(level)
+    finally:
+        if app is not None:
+            app.terminate()
+            app.wait(timeout=30)
+        if stub is not None:
+            report["openai_stub_requests"] = stub.requests
+            stub.stop()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Report written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="test this running server instead of booting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--converter-config", help="generate random converter weights from this config.json")
+    parser.add_argument("--melo-config", help="also generate random MeloTTS weights from this config.json")
+    parser.add_argument("--checkpoints-dir", default=os.path.join(BACKEND_DIR, "loadtest", "checkpoints"))
+    parser.add_argument("--watermark", action="store_true", help="keep the WavMark watermark step (needs its weights)")
+    parser.add_argument("--openai-latency-ms", type=float, default=800.0)
+    parser.add_argument("--openai-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--corpus", help="directory of .wav clips (default: synthesize --durations)")
+    parser.add_argument("--durations", type=float, nargs="+", default=list(DEFAULT_DURATIONS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--requests", type=int, default=20, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--tone", default="confident")
+    parser.add_argument("--format", help="output format field, e.g. opus")
+    parser.add_argument("--allow-cache-hits", action="store_true", help="send clips unchanged and keep the rewrite cache, so repeats hit the caches")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--startup-timeout", type=float, default=900.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "loadtest", "results",
+                                                         f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"))
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# loadtest/stub_openai.py
+"""
+Minimal OpenAI-compatible chat completions server for offline load tests.
+
+Answers POST /v1/chat/completions after a configurable delay, echoing the
+message being rewritten so downstream TTS gets text of realistic length.
+Point the app at it with openai_base_url=http://127.0.0.1:<port>/v1/.
+
+    python -m loadtest.stub_openai --port 8099 --latency-ms 800 --jitter-ms 300
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Used when the transcript was empty (e.g. synthetic clips Whisper hears no words in)
+FALLBACK_TEXT = "Thanks for waiting. I will send the updated numbers by the end of the day."
+# rewrite.ALL_TONES_PROMPT lists the JSON keys it wants
+TONES_LIST = re.compile(r"for each of these tones: ([^.]+)\.")
+
+
+def _rewrite_of(body: dict) -> str:
+    messages = body.get("messages") or [{}]
+    prompt = messages[-1].get("content") or ""
+    # rewrite.py puts the message after the instructions, separated by a blank line
+    text = prompt.split("\n\n", 1)[-1].strip()
+    text = text or FALLBACK_TEXT
+    tones = TONES_LIST.search(prompt)
+    if (body.get("response_format") or {}).get("type") == "json_object" and tones:
+        return json.dumps({tone.strip(): text for tone in tones.group(1).split(",")})
+    return text
+
+
+class StubOpenAI:
+    """Runs the stub on a background thread; latency is drawn from N(latency_ms, jitter_ms), floored at 0."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 800.0, jitter_ms: float = 200.0):
+        stub = self
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with stub.lock:
+                    stub.requests += 1
+                time.sleep(max(0.0, random.gauss(stub.latency_ms, stub.jitter_ms)) / 1000)
+
+                text = _rewrite_of(body)
+                payload = json.dumps({
+                    "id": f"chatcmpl-stub-{stub.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub-openai", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--jitter-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    stub = StubOpenAI(args.host, args.port, args.latency_ms, args.jitter_ms)
+    print(f"[INFO] Stub OpenAI listening at {stub.base_url}")
+    stub.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,31 @@
-# main.py
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+import threading
+from contextlib import ExitStack
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from enum import Enum
-import os
-import re
-import uuid
-from unidecode import unidecode  # type: ignore
-
-from transcribe import transcribe_audio
-from rewrite import rewrite_text
-from utils import log_interaction, convert_to_wav
-from voice_cloning import synthesize_cloned_speech
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from urllib.parse import quote
+
+import metrics
+import admission
+import model_registry
+import file_store
+import encoding
+import scheduler
+import cancel
+import rewrite
+from pipeline import ToneEnum, STAGES, process_upload, stream_upload
+from batch import process_batch, MAX_BATCH_FILES
 from voice_setup import router as voice_setup_router
+from jobs import router as jobs_router
+from session import router as session_router
 
 app = FastAPI()
 app.include_router(voice_setup_router, prefix="/setup") 
+app.include_router(jobs_router, prefix="/jobs")
+app.include_router(session_router)
 
 # Allow frontend access (you can restrict origins in prod)
 app.add_middleware(
@@ -26,11 +36,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Define tone options using Enum
-class ToneEnum(str, Enum):
-    confident = "confident"
-    polite = "polite"
-    concise = "concise"
+@app.on_event("startup")
+def preload_models():
+    # Load in the background so the server accepts connections (and /healthz) meanwhile
+    threading.Thread(target=model_registry.load_all, name="model-preload", daemon=True).start()
+    if rewrite.REWRITE_CACHE_PREWARM:
+        threading.Thread(target=rewrite.prewarm_rewrite_cache, name="rewrite-prewarm", daemon=True).start()
+    file_store.start_reaper()
+
+@app.get("/healthz")
+def healthz():
+    ready = model_registry.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ok" if ready else "loading", "models": model_registry.status()},
+    )
+
+@app.exception_handler(admission.Overloaded)
+def overloaded_handler(request, exc: admission.Overloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def negotiate_format(request: Request, format: Optional[str], sample_rate: Optional[int] = None) -> str:
+    try:
+        encoding.check_sample_rate(sample_rate)
+        return encoding.negotiate(format, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.exception_handler(cancel.Cancelled)
+def cancelled_handler(request, exc: cancel.Cancelled):
+    # Nobody is listening any more; 499 only shows up in access logs
+    return JSONResponse(status_code=499, content={"detail": str(exc)})
+
+@app.exception_handler(rewrite.RewriteError)
+def rewrite_error_handler(request, exc: rewrite.RewriteError):
+    print(f"[ERROR] {exc}")
+    return JSONResponse(status_code=502, content={"detail": "The rewrite service is unavailable, please try again"})
 
 @app.get("/tones/")
 def get_tones():
@@ -38,61 +83,107 @@ def get_tones():
 
 @app.post("/process/")
 async def process_audio(
+    request: Request,
+    file: UploadFile = File(...),
+    tone: ToneEnum = Form(...),
+    user_id: str = Form(...),
+    format: Optional[str] = Form(None),
+    sample_rate: Optional[int] = Form(None),
+    regenerate: bool = Form(False)
+):
+    output_format = negotiate_format(request, format, sample_rate)
+
+    with admission.admit("process"), metrics.request("process"):
+        with metrics.stage("upload"):
+            data = await file.read()
+
+        try:
+            # Models run off the event loop so other connections stay responsive
+            async with cancel.cancel_on_disconnect(request) as token:
+                return await run_in_threadpool(process_upload, data, file.filename, tone.value, user_id,
+                                               output_format=output_format, output_rate=sample_rate, cancel=token,
+                                               regenerate=regenerate)
+        except (admission.Overloaded, cancel.Cancelled, rewrite.RewriteError):
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/process/batch")
+async def process_audio_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    tone: ToneEnum = Form(...),
+    user_id: str = Form(...),
+    format: Optional[str] = Form(None),
+    sample_rate: Optional[int] = Form(None),
+    regenerate: bool = Form(False)
+):
+    output_format = negotiate_format(request, format, sample_rate)
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FILES} files per batch")
+
+    with admission.admit("batch"), metrics.request("batch"):
+        with metrics.stage("upload"):
+            uploads = [(await f.read(), f.filename) for f in files]
+
+        try:
+            cost = sum(scheduler.estimate_cost(scheduler.estimate_duration(data), STAGES) for data, _ in uploads)
+            async with cancel.cancel_on_disconnect(request) as token:
+                results = await run_in_threadpool(scheduler.run, process_batch, uploads, tone.value, user_id,
+                                                  output_format, sample_rate, token, regenerate,
+                                                  priority="batch", cost=cost, cancel=token)
+        except (admission.Overloaded, cancel.Cancelled, rewrite.RewriteError):
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return {"tone": tone.value, "results": results}
+
+@app.post("/process/stream")
+async def process_audio_stream(
+    request: Request,
     file: UploadFile = File(...),
     tone: ToneEnum = Form(...),
-    user_id: str = Form(...)
+    user_id: str = Form(...),
+    regenerate: bool = Form(False)
 ):
-    ext = os.path.splitext(file.filename)[1].lower()
-    temp_id = str(uuid.uuid4())
-    input_path = f"temp_{temp_id}{ext}"
-    wav_path = input_path.rsplit(".", 1)[0] + ".wav"
-    output_path = f"audio/rewritten_{temp_id}.wav"
-    os.makedirs("audio", exist_ok=True)
+    with metrics.stage("upload"):
+        data = await file.read()
 
+    # Ingress is held until the body has been sent, since synthesis happens while
+    # streaming; it also bounds the sentences that wait for a synthesize slot mid-stream
+    hold = ExitStack()
     try:
-        with open(input_path, "wb") as f:
-            f.write(await file.read())
-
-        if ext != ".wav":
-            convert_to_wav(input_path, wav_path)
-            os.remove(input_path)
-        else:
-            wav_path = input_path
-
-        original = transcribe_audio(wav_path)
-        rewritten = rewrite_text(original, tone.value)
-
-        safe_text = unidecode(rewritten)
-        safe_text = re.sub(r"[^a-zA-Z0-9 .,?!'\"-]", "", safe_text).strip()[:300]
-
-        synthesize_cloned_speech(wav_path, safe_text, output_path, user_id)
-        log_interaction(tone.value, original, rewritten)
-
-        return {
-            "original": original,
-            "rewritten": rewritten,
-            "tone": tone.value,
-            "audio_url": f"/files/{os.path.basename(output_path)}"
-        }
-
+        hold.enter_context(admission.admit("stream"))
+        hold.enter_context(metrics.request("stream"))
+        async with cancel.cancel_on_disconnect(request) as token:
+            original, rewritten, chunks = await run_in_threadpool(stream_upload, data, file.filename, tone.value,
+                                                                  user_id, cancel=token, regenerate=regenerate)
+    except (admission.Overloaded, cancel.Cancelled, rewrite.RewriteError):
+        hold.close()
+        raise
     except Exception as e:
+        hold.close()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if os.path.exists(wav_path):
-            os.remove(wav_path)
+
+    def body():
+        try:
+            yield from chunks
+        finally:
+            hold.close()
+
+    # Texts travel in headers so the body can start with audio right away
+    headers = {
+        "X-Original-Text": quote(original),
+        "X-Rewritten-Text": quote(rewritten),
+        "X-Tone": tone.value,
+    }
+    # The background task covers clients that disconnect before the body finishes
+    return StreamingResponse(body(), media_type="audio/wav", headers=headers, background=BackgroundTask(hold.close))
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/files/{file_path:path}")
-def get_audio_file(file_path: str):
-    full_path = os.path.join("audio", file_path)
-    if not os.path.exists(full_path):
-        raise HTTPException(status_code=404, detail="File not found")
-
-    ext = file_path.split(".")[-1].lower()
-    media_type = {
-        "wav": "audio/wav",
-        "mp3": "audio/mpeg",
-        "m4a": "audio/mp4",
-        "mp4": "audio/mp4"
-    }.get(ext, "application/octet-stream")
-
-    return FileResponse(full_path, media_type=media_type)
\ No newline at end of file
+def get_audio_file(file_path: str, request: Request):
+    return file_store.file_response(request, file_store.resolve(file_store.AUDIO_DIR, file_path))
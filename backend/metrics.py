@@ -0,0 +1,189 @@
+# metrics.py
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry = []
+_lock = threading.Lock()
+_worker = None  # set in serve.py workers, whose metrics are per process
+
+
+def set_worker(name):
+    """Adds worker=name to every exported sample, so scrapes of different workers can be told apart."""
+    global _worker
+    _worker = name
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra or [])
+    if _worker is not None:
+        pairs.append(("worker", _worker))
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        """
+        Args:
+            function (callable): Optional; read at scrape time instead of
+                stored values. Returns a number, or a dict mapping label
+                value tuples to numbers.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self.values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        if self.function is None:
+            with _lock:
+                return list(self.values.items())
+        value = self.function()
+        if isinstance(value, dict):
+            return list(value.items())
+        return [((), value)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self.values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = [(k, {"counts": list(v["counts"]), "sum": v["sum"], "count": v["count"]}) for k, v in self.values.items()]
+        for labelvalues, state in items:
+            for bound, count in zip(self.buckets, state["counts"]):
+                labels = _format_labels(self.labelnames, labelvalues, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = Histogram(
+    "voicemask_stage_seconds", "Time spent in each pipeline stage.", ["stage"]
+)
+stage_in_flight = Gauge(
+    "voicemask_stage_in_flight", "Pipeline stages currently executing.", ["stage"]
+)
+request_seconds = Histogram(
+    "voicemask_request_seconds", "End-to-end latency of pipeline endpoints.", ["endpoint"]
+)
+requests_in_flight = Gauge(
+    "voicemask_requests_in_flight", "Pipeline requests currently being served.", ["endpoint"]
+)
+
+_caches = {}
+
+
+def register_cache(name, cache):
+    """Exposes an LRUCache's hit/miss counters and size under cache=name."""
+    _caches[name] = cache
+
+
+def _cache_stat(field):
+    return lambda: {(name,): cache.stats()[field] for name, cache in list(_caches.items())}
+
+
+cache_hits = Counter("voicemask_cache_hits_total", "Cache lookups that returned a value.", ["cache"], function=_cache_stat("hits"))
+cache_misses = Counter("voicemask_cache_misses_total", "Cache lookups that missed.", ["cache"], function=_cache_stat("misses"))
+cache_entries = Gauge("voicemask_cache_entries", "Entries currently held by each cache.", ["cache"], function=_cache_stat("entries"))
+
+
+@contextmanager
+def stage(name):
+    """Times a pipeline stage: upload, decode, transcribe, rewrite, se_load,
+    se_extract, tts_base, tone_convert, watermark or file_write."""
+    stage_in_flight.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+        stage_in_flight.dec(stage=name)
+
+
+@contextmanager
+def request(endpoint):
+    requests_in_flight.inc(endpoint=endpoint)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+        requests_in_flight.dec(endpoint=endpoint)
@@ -0,0 +1,80 @@
+# microbatch.py
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+batch_sizes = metrics.Histogram(
+    "voicemask_microbatch_size", "Items per micro-batch run.", ["batcher"], buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+
+class MicroBatcher:
+    """
+    Groups items submitted from many threads into batches for one model call.
+
+    A batch runs once max_batch_size items are waiting or max_wait_ms after
+    its first item arrived, whichever is sooner. run_batch(items) must
+    return one result per item, in order; if it raises, every item in the
+    batch gets the exception.
+    """
+
+    def __init__(self, name: str, run_batch, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._reset()
+        # Lock and pending items inherited from the parent are reset in each forked worker (serve.py)
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.pending = []
+        self.cond = threading.Condition()
+        self.thread = None
+        self.pid = None
+
+    def _start_thread(self):
+        # Started lazily, and again after a fork, since threads don't survive fork()
+        if self.pid != os.getpid():
+            self.thread = threading.Thread(target=self._loop, name=f"microbatch-{self.name}", daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self.cond:
+            self._start_thread()
+            self.pending.append((time.monotonic(), item, future))
+            self.cond.notify()
+        return future
+
+    def _next_batch(self):
+        with self.cond:
+            while not self.pending:
+                self.cond.wait()
+            deadline = self.pending[0][0] + self.max_wait
+            while len(self.pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch, self.pending = self.pending[:self.max_batch_size], self.pending[self.max_batch_size:]
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = [(item, future) for _, item, future in self._next_batch() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            batch_sizes.observe(len(batch), batcher=self.name)
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,181 @@
+# model_registry.py
+import os
+import sys
+import threading
+import torch # type: ignore
+
+from openvoice.utils import get_hparams_from_file
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINTS_DIR = os.getenv("CHECKPOINTS_DIR", os.path.join(BASE_DIR, "checkpoints"))
+CONVERTER_CONFIG = os.path.join(CHECKPOINTS_DIR, "converter", "config.json")
+CONVERTER_CKPT = os.path.join(CHECKPOINTS_DIR, "converter", "checkpoint.pth")
+# Optional local MeloTTS weights; by default melo downloads them from the HF hub
+MELO_CONFIG = os.getenv("MELO_CONFIG") or None
+MELO_CKPT = os.getenv("MELO_CKPT") or None
+WATERMARK_ENABLED = os.getenv("WATERMARK_ENABLED", "1") != "0"
+
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "tiny")  # or "base" — smaller models for t2.micro
+# "whisper" (openai-whisper, fp32 on CPU) or "faster-whisper" (CTranslate2, int8 on CPU)
+TRANSCRIBE_ENGINE = os.getenv("TRANSCRIBE_ENGINE", "whisper")
+if TRANSCRIBE_ENGINE not in ("whisper", "faster-whisper"):
+    raise ValueError(f"TRANSCRIBE_ENGINE must be 'whisper' or 'faster-whisper', not '{TRANSCRIBE_ENGINE}'")
+SE_WHISPER_MODEL_SIZE = "medium"  # only used by se_extractor.get_se(vad=False)
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "float16" if device == "cuda" else "int8")
+# Dynamic int8 quantization of openai-whisper's Linear layers (CPU only)
+WHISPER_INT8 = os.getenv("WHISPER_INT8", "0") != "0" and device == "cpu"
+# Chunks of one long clip decoded at once; also faster-whisper's parallel workers
+TRANSCRIBE_CHUNK_WORKERS = int(os.getenv("TRANSCRIBE_CHUNK_WORKERS", "2"))
+
+# Read from the config alone so callers can know rates/versions without loading weights
+converter_hparams = get_hparams_from_file(CONVERTER_CONFIG)
+CONVERTER_VERSION = getattr(converter_hparams, "_version_", "v1")
+CONVERTER_SAMPLE_RATE = converter_hparams.data.sampling_rate
+
+
+def _load_converter():
+    from openvoice.api import ToneColorConverter
+    converter = ToneColorConverter(CONVERTER_CONFIG, device=device, enable_watermark=WATERMARK_ENABLED)
+    converter.load_ckpt(CONVERTER_CKPT)
+    return converter
+
+
+def _load_melo():
+    sys.path.append(os.path.join(BASE_DIR, "openVoice"))
+    from melo.api import TTS as MeloTTS # type: ignore
+    return MeloTTS(language="EN", device=device, config_path=MELO_CONFIG, ckpt_path=MELO_CKPT)
+
+
+def _plain_linears(module):
+    # whisper.model.Linear overrides forward for dtype casting; quantize_dynamic only
+    # matches exact nn.Linear types, so swap in plain copies first
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+            plain = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+            plain.load_state_dict(child.state_dict())
+            setattr(module, name, plain)
+        else:
+            _plain_linears(child)
+
+
+def quantize_whisper(model):
+    """Returns an openai-whisper model with its Linear layers dynamically quantized to int8 (CPU)."""
+    model.eval()
+    _plain_linears(model)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_whisper():
+    import whisper
+    model = whisper.load_model(WHISPER_MODEL_SIZE, device=device)
+    if WHISPER_INT8:
+        model = quantize_whisper(model)
+    return model
+
+
+def _load_faster_whisper():
+    from faster_whisper import WhisperModel
+    return WhisperModel(WHISPER_MODEL_SIZE, device=device, compute_type=FASTER_WHISPER_COMPUTE_TYPE,
+                        num_workers=TRANSCRIBE_CHUNK_WORKERS)
+
+
+def _load_se_whisper():
+    from faster_whisper import WhisperModel
+    from openvoice import se_extractor
+    compute_type = "float16" if device == "cuda" else "int8"
+    model = WhisperModel(SE_WHISPER_MODEL_SIZE, device=device, compute_type=compute_type)
+    se_extractor.model = model  # se_extractor.split_audio_whisper reads its module global
+    return model
+
+
+LOADERS = {
+    "converter": _load_converter,
+    "melo": _load_melo,
+    "whisper": _load_whisper,
+    "faster_whisper": _load_faster_whisper,
+    "se_whisper": _load_se_whisper,
+}
+TRANSCRIBER = "faster_whisper" if TRANSCRIBE_ENGINE == "faster-whisper" else "whisper"
+REQUIRED = ["converter", "melo", TRANSCRIBER]  # needed before /healthz reports ready
+
+_models = {}
+_errors = {}
+_locks = {name: threading.Lock() for name in LOADERS}
+
+
+def get(name: str):
+    """Returns the shared instance of a model, loading it on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _locks[name]:
+        if name not in _models:
+            print(f"[INFO] Loading model '{name}' ...")
+            try:
+                _models[name] = LOADERS[name]()
+                _errors.pop(name, None)
+            except Exception as e:
+                _errors[name] = str(e)
+                raise
+            print(f"[INFO] Model '{name}' loaded.")
+        return _models[name]
+
+
+def get_converter():
+    return get("converter")
+
+
+def get_melo():
+    return get("melo")
+
+
+def get_whisper():
+    return get("whisper")
+
+
+def get_faster_whisper():
+    return get("faster_whisper")
+
+
+def get_transcriber():
+    """The model behind transcribe.py for the configured TRANSCRIBE_ENGINE."""
+    return get(TRANSCRIBER)
+
+
+def get_se_whisper():
+    return get("se_whisper")
+
+
+def loaded() -> dict:
+    """Models loaded so far, by name."""
+    return dict(_models)
+
+
+def load_all(names=None):
+    """Loads the given models (default: REQUIRED), logging rather than raising failures."""
+    for name in names or REQUIRED:
+        try:
+            get(name)
+        except Exception as e:
+            print(f"[ERROR] Failed to load model '{name}':", str(e))
+
+
+def status() -> dict:
+    states = {}
+    for name in LOADERS:
+        if name in _models:
+            states[name] = "loaded"
+        elif name in _errors:
+            states[name] = f"error: {_errors[name]}"
+        elif _locks[name].locked():
+            states[name] = "loading"
+        else:
+            states[name] = "not_loaded"
+    return states
+
+
+def is_ready() -> bool:
+    return all(name in _models for name in REQUIRED)
@@ -100,9 +100,10 @@ class BaseSpeakerTTS(OpenVoiceBaseClass):
 
 class ToneColorConverter(OpenVoiceBaseClass):
     def __init__(self, *args, **kwargs):
+        enable_watermark = kwargs.pop('enable_watermark', True)
         super().__init__(*args, **kwargs)
 
-        if kwargs.get('enable_watermark', True):
+        if enable_watermark:
             import wavmark
             self.watermark_model = wavmark.load_model().to(self.device)
         else:
@@ -112,7 +113,7 @@ class ToneColorConverter(OpenVoiceBaseClass):
 
 
     def extract_se(self, ref_wav_list, se_save_path=None):
-        if isinstance(ref_wav_list, str):
+        if isinstance(ref_wav_list, (str, np.ndarray)):
             ref_wav_list = [ref_wav_list]
         
         device = self.device
@@ -120,7 +121,11 @@ class ToneColorConverter(OpenVoiceBaseClass):
         gs = []
         
         for fname in ref_wav_list:
-            audio_ref, sr = librosa.load(fname, sr=hps.data.sampling_rate)
+            # Arrays are taken to be at hps.data.sampling_rate already
+            if isinstance(fname, np.ndarray):
+                audio_ref = fname
+            else:
+                audio_ref, sr = librosa.load(fname, sr=hps.data.sampling_rate)
             y = torch.FloatTensor(audio_ref)
             y = y.to(device)
             y = y.unsqueeze(0)
@@ -138,10 +143,15 @@ class ToneColorConverter(OpenVoiceBaseClass):
 
         return gs
 
-    def convert(self, audio_src_path, src_se, tgt_se, output_path=None, tau=0.3, message="default"):
+    def convert(self, audio_src_path, src_se, tgt_se, output_path=None, tau=0.3, message="default", src_sample_rate=None, watermark=True):
         hps = self.hps
-        # load audio
-        audio, sample_rate = librosa.load(audio_src_path, sr=hps.data.sampling_rate)
+        # load audio, or take it from memory when given an array at src_sample_rate
+        if isinstance(audio_src_path, np.ndarray):
+            audio = audio_src_path
+            if src_sample_rate is not None and src_sample_rate != hps.data.sampling_rate:
+                audio = librosa.resample(audio, orig_sr=src_sample_rate, target_sr=hps.data.sampling_rate)
+        else:
+            audio, sample_rate = librosa.load(audio_src_path, sr=hps.data.sampling_rate)
         audio = torch.tensor(audio).float()
         
         with torch.no_grad():
@@ -153,13 +163,45 @@ class ToneColorConverter(OpenVoiceBaseClass):
             spec_lengths = torch.LongTensor([spec.size(-1)]).to(self.device)
             audio = self.model.voice_conversion(spec, spec_lengths, sid_src=src_se, sid_tgt=tgt_se, tau=tau)[0][
                         0, 0].data.cpu().float().numpy()
-            audio = self.add_watermark(audio, message)
+            if watermark:
+                audio = self.add_watermark(audio, message)
             if output_path is None:
                 return audio
             else:
                 soundfile.write(output_path, audio, hps.data.sampling_rate)
     
-    def add_watermark(self, audio, message):
+    def convert_batch(self, audio_list, sample_rate, src_se, tgt_se, tau=0.3, message="default", watermark=True):
+        """Converts several clips in one padded forward pass, masked by their spectrogram lengths."""
+        hps = self.hps
+        hop_length = hps.data.hop_length
+
+        specs = []
+        for audio in audio_list:
+            if sample_rate != hps.data.sampling_rate:
+                audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=hps.data.sampling_rate)
+            y = torch.FloatTensor(audio).to(self.device).unsqueeze(0)
+            specs.append(spectrogram_torch(y, hps.data.filter_length,
+                                    hps.data.sampling_rate, hop_length, hps.data.win_length,
+                                    center=False)[0])
+
+        spec_lengths = torch.LongTensor([spec.size(-1) for spec in specs]).to(self.device)
+        max_len = int(spec_lengths.max())
+        spec = torch.stack([torch.nn.functional.pad(s, (0, max_len - s.size(-1))) for s in specs]).to(self.device)
+        batch_size = spec.size(0)
+        src = src_se.expand(batch_size, -1, -1) if src_se is not None else None
+        tgt = tgt_se.expand(batch_size, -1, -1)
+
+        with torch.no_grad():
+            out = self.model.voice_conversion(spec, spec_lengths, sid_src=src, sid_tgt=tgt, tau=tau)[0]
+            out = out[:, 0].data.cpu().float().numpy()
+
+        audios = [out[i, :int(n) * hop_length].copy() for i, n in enumerate(spec_lengths)]
+        if watermark:
+            audios = [self.add_watermark(audio, message) for audio in audios]
+        return audios
+
+    def add_watermark(self, audio, message, check=None):
+        # check: optional callable run before each chunk; it may raise to abort
         if self.watermark_model is None:
             return audio
         device = self.device
@@ -169,6 +211,8 @@ class ToneColorConverter(OpenVoiceBaseClass):
         K = 16000
         coeff = 2
         for n in range(n_repeat):
+            if check is not None:
+                check()
             trunck = audio[(coeff * n) * K: (coeff * n + 1) * K]
             if len(trunck) != K:
                 print('Audio too short, fail to add watermark')
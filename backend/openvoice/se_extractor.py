@@ -1,5 +1,6 @@
 import os
 import glob
+import threading
 import torch
 import hashlib
 import librosa
@@ -13,6 +14,10 @@ import base64
 import librosa
 from whisper_timestamped.transcribe import get_audio_tensor, get_vad_segments
 
+# whisper_timestamped loads one global silero model lazily and it keeps recurrent state
+# between windows, so concurrent VAD calls would mix each other's segments
+_vad_lock = threading.Lock()
+
 model_size = "medium"
 # Run on GPU with FP16
 model = None
@@ -77,13 +82,14 @@ def split_audio_whisper(audio_path, audio_name, target_dir='processed'):
 def split_audio_vad(audio_path, audio_name, target_dir, split_seconds=10.0):
     SAMPLE_RATE = 16000
     audio_vad = get_audio_tensor(audio_path)
-    segments = get_vad_segments(
-        audio_vad,
-        output_sample=True,
-        min_speech_duration=0.1,
-        min_silence_duration=1,
-        method="silero",
-    )
+    with _vad_lock:
+        segments = get_vad_segments(
+            audio_vad,
+            output_sample=True,
+            min_speech_duration=0.1,
+            min_silence_duration=1,
+            method="silero",
+        )
     segments = [(seg["start"], seg["end"]) for seg in segments]
     segments = [(float(s) / SAMPLE_RATE, float(e) / SAMPLE_RATE) for s,e in segments]
     print(segments)
@@ -115,8 +121,35 @@ def split_audio_vad(audio_path, audio_name, target_dir, split_seconds=10.0):
         count += 1
     return wavs_folder
 
+def vad_speech_segments(audio_16k, min_silence_duration=1):
+    """Silero speech segments of 16 kHz samples, as (start, end) sample indices."""
+    with _vad_lock:
+        segments = get_vad_segments(
+            torch.from_numpy(audio_16k),
+            output_sample=True,
+            min_speech_duration=0.1,
+            min_silence_duration=min_silence_duration,
+            method="silero",
+        )
+    return [(int(seg["start"]), int(seg["end"])) for seg in segments]
+
+def split_audio_vad_array(audio, sample_rate, split_seconds=10.0):
+    SAMPLE_RATE = 16000
+    segments = vad_speech_segments(librosa.resample(audio, orig_sr=sample_rate, target_sr=SAMPLE_RATE))
+    segments = [(s * sample_rate // SAMPLE_RATE, e * sample_rate // SAMPLE_RATE) for s, e in segments]
+    audio_active = np.concatenate([audio[s:e] for s, e in segments]) if segments else audio[:0]
+
+    audio_dur = len(audio_active) / sample_rate
+    print(f'after vad: dur = {audio_dur}')
+    num_splits = int(np.round(audio_dur / split_seconds))
+    assert num_splits > 0, 'input audio is too short'
+    return np.array_split(audio_active, num_splits)
+
 def hash_numpy_array(audio_path):
-    array, _ = librosa.load(audio_path, sr=None, mono=True)
+    if isinstance(audio_path, np.ndarray):
+        array = audio_path
+    else:
+        array, _ = librosa.load(audio_path, sr=None, mono=True)
     # Convert the array to bytes
     array_bytes = array.tobytes()
     # Calculate the hash of the array bytes
@@ -131,6 +164,13 @@ def get_se(audio_path, vc_model, target_dir='processed', vad=True):
     version = vc_model.version
     print("OpenVoice version:", version)
 
+    # In-memory samples at the converter's sampling rate: VAD-split and extract without touching disk
+    if isinstance(audio_path, np.ndarray):
+        assert vad, 'whisper splitting needs an audio file'
+        audio_name = f"memory_{version}_{hash_numpy_array(audio_path)}"
+        audio_segs = split_audio_vad_array(audio_path, vc_model.hps.data.sampling_rate)
+        return vc_model.extract_se(audio_segs), audio_name
+
     audio_name = f"{os.path.basename(audio_path).rsplit('.', 1)[0]}_{version}_{hash_numpy_array(audio_path)}"
     se_path = os.path.join(target_dir, audio_name, 'se.pth')
 
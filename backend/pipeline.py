@@ -0,0 +1,194 @@
+# pipeline.py
+import os
+import re
+import hashlib
+from unidecode import unidecode  # type: ignore
+
+from transcribe import transcribe_audio, TRANSCRIBER_VERSION
+from rewrite import ToneEnum, rewrite_text, REWRITE_MODEL, REWRITE_TEMPERATURE, PROMPT_VERSION
+import metrics
+import scheduler
+from cache import LRUCache
+from singleflight import SingleFlight
+from cancel import Cancelled, checkpoint
+from utils import log_interaction, wav_stream_header, float_to_pcm16
+from audio_io import decode_bytes
+from voice_cloning import synthesize_cloned_speech, stream_cloned_speech, load_target_se, se_version, OUTPUT_SAMPLE_RATE
+from model_registry import CONVERTER_VERSION
+from file_store import AUDIO_DIR, save_audio
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+
+# Finished /process/ results keyed by upload hash, tone, user and model versions
+result_cache = LRUCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS)
+metrics.register_cache("result", result_cache)
+
+# Identical uploads in flight at once (e.g. client retries) share one pipeline run
+process_flight = SingleFlight("process", retry_on=(Cancelled,))
+
+# Stages reported to progress callbacks, in execution order
+STAGES = ["decode", "transcribe", "rewrite", "synthesize"]
+
+def clean_for_tts(text: str) -> str:
+    safe_text = unidecode(text)
+    return re.sub(r"[^a-zA-Z0-9 .,?!'\"-]", "", safe_text).strip()[:300]
+
+
+def _refresh_audio(result) -> bool:
+    # A hit hands the file's URL out again, so its mtime is bumped to keep the reaper off it
+    try:
+        os.utime(os.path.join(AUDIO_DIR, os.path.basename(result["audio_url"])))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def result_cache_key(data: bytes, tone: str, user_id: str, output_format: str = "wav", output_rate: int = None) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    versions = f"{TRANSCRIBER_VERSION}:{REWRITE_MODEL}:{CONVERTER_VERSION}:{se_version(user_id)}"
+    return f"{digest}:{tone}:{user_id}:{output_format}:{output_rate}:{versions}"
+
+
+def process_upload(data: bytes, filename: str, tone: str, user_id: str, on_stage=None,
+                   output_format: str = "wav", output_rate: int = None, priority: str = "interactive",
+                   cancel=None, regenerate: bool = False) -> dict:
+    """
+    Runs the full transcribe -> rewrite -> clone pipeline on an uploaded file.
+
+    Blocking; call it from a worker thread, never from the event loop.
+    A call identical to one already running waits for and shares its
+    result, unless it is already on a scheduler worker. Stages that this call didn't run itself, because of a result
+    cache hit or a shared call, are reported once with status "cached".
+
+    Args:
+        data (bytes): Raw bytes of the uploaded audio.
+        filename (str): Original file name, used for its extension.
+        tone (str): Target tone value.
+        user_id (str): Owner of the cached speaker embedding.
+        on_stage (callable): Optional ``on_stage(stage, status)`` callback,
+            called with status "running" and "done" around each of STAGES,
+            or with "cached" for stages answered by another run.
+        output_format (str): Key of encoding.FORMATS for the result file.
+        output_rate (int): Optional sample rate of the result file.
+        priority (str): Scheduler class the pipeline run queues in, or None
+            to run it on the calling thread (already scheduled callers).
+            Such calls never wait on an identical run, which may itself be
+            queued behind the worker they hold.
+        cancel (CancelToken): Optional; checked between stages so a run
+            whose client has gone away stops early and writes no file.
+        regenerate (bool): Skip the result and rewrite caches and ask the
+            LLM for a fresh rewrite; the new result replaces the cached one.
+
+    Returns:
+        dict: original, rewritten, tone and audio_url of the result.
+    """
+    reported = set()
+
+    def report(stage, status):
+        reported.add(stage)
+        if on_stage is not None:
+            on_stage(stage, status)
+
+    def report_cached():
+        for stage in STAGES:
+            if stage not in reported:
+                report(stage, "cached")
+
+    cache_key = result_cache_key(data, tone, user_id, output_format, output_rate)
+    cached = None if regenerate else result_cache.get(cache_key, validate=_refresh_audio)
+    if cached is not None:
+        print(f"[INFO] Result cache hit for user_id={user_id}, tone={tone}")
+        report_cached()
+        return dict(cached)
+
+    def compute():
+        args = (data, filename, tone, user_id, report, output_format, output_rate, cancel, regenerate)
+        if priority is None:
+            return _run_pipeline(*args)
+        cost = scheduler.estimate_cost(scheduler.estimate_duration(data), STAGES)
+        return scheduler.run(_run_pipeline, *args, priority=priority, cost=cost, cancel=cancel)
+
+    if priority is None:
+        result = compute()
+    else:
+        # Regenerate calls mustn't join a normal run, which may answer from the rewrite cache
+        result = process_flight.do(f"{cache_key}:regenerate" if regenerate else cache_key, compute)
+    result_cache.put(cache_key, result)
+    report_cached()
+    return dict(result)
+
+
+def _run_pipeline(data, filename, tone, user_id, report, output_format, output_rate, cancel, regenerate=False) -> dict:
+    checkpoint(cancel, "decode")
+    report("decode", "running")
+    with metrics.stage("decode"):
+        audio = decode_bytes(data, filename)
+    report("decode", "done")
+
+    report("transcribe", "running")
+    original = transcribe_audio(audio, cancel)
+    report("transcribe", "done")
+
+    report("rewrite", "running")
+    rewritten = rewrite_text(original, tone, cancel, regenerate)
+    report("rewrite", "done")
+
+    report("synthesize", "running")
+    cloned = synthesize_cloned_speech(audio, clean_for_tts(rewritten), None, user_id, cancel=cancel)
+    checkpoint(cancel, "file_write")
+    with metrics.stage("file_write"):
+        output_name = save_audio(cloned, OUTPUT_SAMPLE_RATE, fmt=output_format, target_rate=output_rate)
+    report("synthesize", "done")
+    log_interaction(tone, original, rewritten, model=REWRITE_MODEL, temperature=REWRITE_TEMPERATURE,
+                    prompt_version=PROMPT_VERSION)
+
+    return {
+        "original": original,
+        "rewritten": rewritten,
+        "tone": tone,
+        "audio_url": f"/files/{output_name}"
+    }
+
+
+def stream_upload(data: bytes, filename: str, tone: str, user_id: str, cancel=None, regenerate: bool = False):
+    """
+    Transcribes and rewrites an upload, then returns a lazy stream of the
+    cloned speech so playback can start after the first sentence.
+
+    Blocking up to the rewrite; iterate the stream from a worker thread too.
+    The optional CancelToken covers the blocking part; the stream itself
+    stops when the response stops pulling sentences from it.
+
+    The speaker embedding and the first sentence are ready before this
+    returns, so Overloaded is raised before any response is sent. Later
+    sentences each wait for a synthesize slot rather than failing a
+    response that has already started.
+
+    Returns:
+        tuple: (original, rewritten, chunks) where chunks yields a streaming
+        WAV header followed by 16-bit PCM for each synthesized sentence.
+    """
+    def prepare():
+        with metrics.stage("decode"):
+            audio = decode_bytes(data, filename)
+        original = transcribe_audio(audio, cancel)
+        rewritten = rewrite_text(original, tone, cancel, regenerate)
+        return original, rewritten, load_target_se(audio, user_id)
+
+    cost = scheduler.estimate_cost(scheduler.estimate_duration(data), ["decode", "transcribe", "rewrite"])
+    original, rewritten, target_se = scheduler.run(prepare, priority="interactive", cost=cost, cancel=cancel)
+    log_interaction(tone, original, rewritten, model=REWRITE_MODEL, temperature=REWRITE_TEMPERATURE,
+                    prompt_version=PROMPT_VERSION)
+    sentences = stream_cloned_speech(None, clean_for_tts(rewritten), target_se=target_se, committed=True)
+    first = next(sentences, None)
+
+    def chunks():
+        yield wav_stream_header(OUTPUT_SAMPLE_RATE)
+        if first is None:
+            return
+        yield float_to_pcm16(first)
+        for sentence_audio in sentences:
+            yield float_to_pcm16(sentence_audio)
+
+    return original, rewritten, chunks()
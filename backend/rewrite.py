@@ -1,24 +1,279 @@
 import openai # type: ignore
 import os
+import json
+import time
+import hashlib
+import random
+import asyncio
+import threading
+import httpx
+from enum import Enum
+from concurrent.futures import CancelledError
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+import metrics
+import admission
+from cancel import checkpoint
+from cache import LRUCache, SQLiteCache, TieredCache
+
 load_dotenv()
-openai.api_key = os.getenv("openai_key") # Need to add an OpenAI key to a .env file in order for rewrite.py to rewrite your speech
+OPENAI_KEY = os.getenv("openai_key") # Need to add an OpenAI key to a .env file in order for rewrite.py to rewrite your speech
+OPENAI_BASE_URL = os.getenv("openai_base_url") or None  # any OpenAI-compatible server, e.g. loadtest/stub_openai.py
 
-def rewrite_text(text: str, tone: str = "confident") -> str:
-    prompt = (
-        f"You are a communication coach. Rewrite the following message to sound more {tone}, "
-        f"while keeping the original meaning and keeping it short and natural:\n\n{text}"
-    )
+# Define tone options using Enum
+class ToneEnum(str, Enum):
+    confident = "confident"
+    polite = "polite"
+    concise = "concise"
 
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=200,
+
+REWRITE_MODEL = "gpt-4.1-mini"
+REWRITE_TEMPERATURE = 0.7
+REWRITE_MAX_TOKENS = 200  # per variant
+REWRITE_PROMPT = (
+    "You are a communication coach. Rewrite the following message to sound more {tone}, "
+    "while keeping the original meaning and keeping it short and natural:\n\n{text}"
+)
+# Users often try several tones on one recording; this mode asks for all of them in one
+# JSON completion and caches each, so later tone switches don't reach the LLM
+REWRITE_ALL_TONES = os.getenv("REWRITE_ALL_TONES", "0") != "0"
+ALL_TONES_PROMPT = (
+    "You are a communication coach. Rewrite the following message once for each of these tones: {tones}. "
+    "Keep the original meaning and keep each version short and natural. Answer with a JSON object "
+    "whose keys are exactly those tone names and whose values are the rewrites:\n\n{text}"
+)
+# Changes whenever the prompt in use does, so cached rewrites from an older prompt aren't reused
+PROMPT_VERSION = hashlib.sha256((ALL_TONES_PROMPT if REWRITE_ALL_TONES else REWRITE_PROMPT).encode()).hexdigest()[:12]
+# Per-attempt timeout, and the deadline for a rewrite including retries and backoff
+REWRITE_TIMEOUT_SECONDS = float(os.getenv("REWRITE_TIMEOUT_SECONDS", "15"))
+REWRITE_DEADLINE_SECONDS = float(os.getenv("REWRITE_DEADLINE_SECONDS", "30"))
+REWRITE_MAX_RETRIES = int(os.getenv("REWRITE_MAX_RETRIES", "2"))
+REWRITE_BACKOFF_SECONDS = float(os.getenv("REWRITE_BACKOFF_SECONDS", "0.5"))
+# Keep-alive pool shared by every rewrite in this process
+REWRITE_MAX_CONNECTIONS = int(os.getenv("REWRITE_MAX_CONNECTIONS", "32"))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Rewrites by normalized text, tone, model, temperature and prompt version; the same
+# transcript in the same tone is a repeat paid call otherwise
+REWRITE_CACHE_MAX_ENTRIES = int(os.getenv("REWRITE_CACHE_MAX_ENTRIES", "5000"))
+REWRITE_CACHE_DISK_MAX_ENTRIES = int(os.getenv("REWRITE_CACHE_DISK_MAX_ENTRIES", "100000"))
+REWRITE_CACHE_TTL_SECONDS = int(os.getenv("REWRITE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+REWRITE_CACHE_PATH = os.getenv("REWRITE_CACHE_PATH", os.path.join(BASE_DIR, "cache", "rewrites.sqlite3"))
+REWRITE_CACHE_PREWARM = os.getenv("REWRITE_CACHE_PREWARM", "1") != "0"
+HISTORY_PATH = os.getenv("REWRITE_HISTORY_PATH", "history.jsonl")  # same relative path utils.log_interaction writes
+# history.jsonl lines written before model/prompt_version were logged came from these
+HISTORY_DEFAULTS = {"model": "gpt-4.1-mini", "temperature": 0.7, "prompt_version": "588bc42b78fc"}
+FAILED_REWRITE = "Sorry, something went wrong with rewriting."  # placeholder older versions logged on errors
+
+rewrite_cache = TieredCache(
+    LRUCache(REWRITE_CACHE_MAX_ENTRIES, REWRITE_CACHE_TTL_SECONDS),
+    SQLiteCache(REWRITE_CACHE_PATH, REWRITE_CACHE_DISK_MAX_ENTRIES, REWRITE_CACHE_TTL_SECONDS) if REWRITE_CACHE_PATH else None,
+)
+metrics.register_cache("rewrite", rewrite_cache)
+if rewrite_cache.disk is not None:
+    metrics.register_cache("rewrite_disk", rewrite_cache.disk)
+
+RETRYABLE = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+retries = metrics.Counter("voicemask_rewrite_retries_total", "Rewrite attempts retried, by error.", ["error"])
+failures = metrics.Counter("voicemask_rewrite_failures_total", "Rewrites given up on, by error.", ["error"])
+
+
+class RewriteError(Exception):
+    """Raised when the LLM couldn't produce a rewrite within the retry budget; maps to 502."""
+
+
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+_loop_pid = None
+
+
+def _background_loop():
+    """Returns the event loop that owns the shared client, starting it on first use (and after a fork)."""
+    global _loop, _client, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _client = None
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="rewrite-loop", daemon=True).start()
+        return _loop
+
+
+def _get_client() -> openai.AsyncOpenAI:
+    # Only called on the background loop, so the pool's connections stay on one loop
+    global _client
+    if _client is None:
+        _client = openai.AsyncOpenAI(
+            api_key=OPENAI_KEY,
+            base_url=OPENAI_BASE_URL,
+            timeout=REWRITE_TIMEOUT_SECONDS,
+            max_retries=0,  # retried below, under the overall deadline
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=REWRITE_MAX_CONNECTIONS,
+                                    max_keepalive_connections=REWRITE_MAX_CONNECTIONS),
+                timeout=REWRITE_TIMEOUT_SECONDS,
+            ),
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"OpenAI API error: {e}")
-        return "Sorry, something went wrong with rewriting."
+    return _client
+
+
+def build_prompt(text: str, tone: str) -> str:
+    return REWRITE_PROMPT.format(tone=tone, text=text)
+
+
+def build_all_tones_prompt(text: str, tones) -> str:
+    return ALL_TONES_PROMPT.format(tones=", ".join(tones), text=text)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def rewrite_cache_key(text: str, tone: str, model: str = REWRITE_MODEL, temperature: float = REWRITE_TEMPERATURE,
+                      prompt_version: str = PROMPT_VERSION) -> str:
+    key = json.dumps([normalize_text(text), tone, model, temperature, prompt_version])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def prewarm_rewrite_cache(path: str = HISTORY_PATH) -> int:
+    """
+    Loads rewrites logged in history.jsonl that match the current model,
+    temperature and prompt into rewrite_cache, keeping their original age.
+
+    Returns:
+        int: Number of rewrites loaded.
+    """
+    if not os.path.exists(path):
+        return 0
+    latest = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                settings = {name: record.get(name, default) for name, default in HISTORY_DEFAULTS.items()}
+                created = datetime.fromisoformat(record["timestamp"]).replace(tzinfo=timezone.utc).timestamp()
+                text, tone, output = record["input"], record["tone"], record["output"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            current = settings == {"model": REWRITE_MODEL, "temperature": REWRITE_TEMPERATURE, "prompt_version": PROMPT_VERSION}
+            if not current or not output or output == FAILED_REWRITE or time.time() - created > REWRITE_CACHE_TTL_SECONDS:
+                continue
+            latest[rewrite_cache_key(text, tone)] = (output, created)
+
+    for key, (output, created) in latest.items():
+        rewrite_cache.put(key, output, created)
+    print(f"[INFO] Pre-warmed rewrite cache with {len(latest)} rewrite(s) from {path}")
+    return len(latest)
+
+
+async def _complete(prompt: str, max_tokens: int = REWRITE_MAX_TOKENS, json_mode: bool = False) -> str:
+    """One chat completion with jittered exponential backoff, bounded by REWRITE_DEADLINE_SECONDS."""
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    client = _get_client()
+    deadline = time.monotonic() + REWRITE_DEADLINE_SECONDS
+    for attempt in range(REWRITE_MAX_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        try:
+            response = await asyncio.wait_for(client.chat.completions.create(
+                model=REWRITE_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=REWRITE_TEMPERATURE,
+                max_tokens=max_tokens,
+                **extra,
+            ), timeout=max(remaining, 0.001))
+            return response.choices[0].message.content.strip()
+        except (asyncio.TimeoutError, *RETRYABLE) as e:
+            error = type(e).__name__
+            # Full jitter so callers that failed together don't retry together
+            delay = random.uniform(0, REWRITE_BACKOFF_SECONDS * 2 ** attempt)
+            if attempt == REWRITE_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                failures.inc(error=error)
+                raise RewriteError(f"Rewrite failed after {attempt + 1} attempt(s): {error}") from e
+            retries.inc(error=error)
+            print(f"[INFO] Rewrite attempt {attempt + 1} failed ({error}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        except openai.OpenAIError as e:
+            failures.inc(error=type(e).__name__)
+            raise RewriteError(f"Rewrite failed: {e}") from e
+
+
+async def _rewrite_all_tones(text: str) -> dict:
+    """Every ToneEnum variant of text from one JSON completion, each stored in rewrite_cache."""
+    tones = [tone.value for tone in ToneEnum]
+    content = await _complete(build_all_tones_prompt(text, tones), REWRITE_MAX_TOKENS * len(tones), json_mode=True)
+    try:
+        variants = json.loads(content)
+        variants = {tone: variants[tone].strip() for tone in tones}
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        failures.inc(error="MalformedJSON")
+        raise RewriteError(f"Rewrite returned malformed tone variants: {type(e).__name__}") from e
+    for tone, rewritten in variants.items():
+        rewrite_cache.put(rewrite_cache_key(text, tone), rewritten)
+    return variants
+
+
+async def _rewrite(text: str, tone: str) -> str:
+    """Asks the LLM for text in tone and caches the answer; runs on the background loop."""
+    if REWRITE_ALL_TONES and tone in [t.value for t in ToneEnum]:
+        return (await _rewrite_all_tones(text))[tone]
+    rewritten = await _complete(build_prompt(text, tone))
+    rewrite_cache.put(rewrite_cache_key(text, tone), rewritten)
+    return rewritten
+
+
+async def rewrite_text_async(text: str, tone: str = "confident", regenerate: bool = False) -> str:
+    """
+    Rewrites text in the given tone without blocking the caller's event loop.
+    Takes a rewrite admission slot like rewrite_text.
+
+    Args:
+        regenerate (bool): Ask the LLM even if a cached rewrite exists.
+
+    Raises:
+        RewriteError: If the LLM didn't answer within the retry budget.
+        Overloaded: If no rewrite slot came free in time.
+    """
+    cached = None if regenerate else rewrite_cache.get(rewrite_cache_key(text, tone))
+    if cached is not None:
+        return cached
+
+    async with admission.stage_async("rewrite"):
+        future = asyncio.run_coroutine_threadsafe(_rewrite(text, tone), _background_loop())
+        with metrics.stage("rewrite"):
+            return await asyncio.wrap_future(future)
+
+
+def rewrite_text(text: str, tone: str = "confident", cancel=None, regenerate: bool = False) -> str:
+    """
+    Blocking rewrite for worker threads. Calls from many threads share one
+    connection pool and overlap their waits on the background loop.
+    Answers from rewrite_cache when it can. With REWRITE_ALL_TONES, a miss
+    fetches and caches every ToneEnum variant at once.
+
+    Args:
+        cancel (CancelToken): Optional; aborts the in-flight call when cancelled.
+        regenerate (bool): Ask the LLM even if a cached rewrite exists; the
+            new rewrite replaces the cached one.
+
+    Raises:
+        RewriteError: If the LLM didn't answer within the retry budget.
+        Cancelled: If cancel fired first.
+    """
+    cached = None if regenerate else rewrite_cache.get(rewrite_cache_key(text, tone))
+    if cached is not None:
+        return cached
+
+    with admission.stage("rewrite"), metrics.stage("rewrite"):
+        checkpoint(cancel, "rewrite")
+        future = asyncio.run_coroutine_threadsafe(_rewrite(text, tone), _background_loop())
+        if cancel is not None:
+            cancel.add_callback(future.cancel)
+        try:
+            return future.result()
+        except CancelledError:
+            cancel.check("rewrite")
+            raise
@@ -0,0 +1,156 @@
+# scheduler.py
+import os
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future, CancelledError
+
+import metrics
+from audio_io import probe_duration
+
+# Lower runs first. Classes are separated by CLASS_OFFSET_SECONDS of estimated cost,
+# so a queued batch job overtakes new interactive work after waiting about
+# 2 * CLASS_OFFSET_SECONDS / AGING_RATE seconds.
+PRIORITIES = {"interactive": 0, "setup": 1, "batch": 2}
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))  # pipeline runs at once; stages keep their own admission limits
+CLASS_OFFSET_SECONDS = float(os.getenv("SCHEDULER_CLASS_OFFSET_SECONDS", "60"))
+AGING_RATE = float(os.getenv("SCHEDULER_AGING_RATE", "1.0"))  # estimated cost-seconds forgiven per second waited
+
+# (fixed seconds, seconds per second of audio) per stage, for a CPU box with the
+# tiny Whisper model; only the relative sizes matter for ordering
+STAGE_COSTS = {
+    "decode": (0.05, 0.01),
+    "transcribe": (0.3, 0.15),
+    "rewrite": (1.0, 0.0),
+    "synthesize": (1.0, 0.6),
+    "setup": (2.0, 0.3),
+}
+
+# Used when an upload's duration can't be read from its header
+FALLBACK_BYTES_PER_SECOND = 16000
+
+
+def estimate_cost(duration: float, stages) -> float:
+    """Estimated seconds of work to run the given stages on audio of this duration."""
+    return sum(STAGE_COSTS[s][0] + STAGE_COSTS[s][1] * duration for s in stages)
+
+
+def estimate_duration(data: bytes) -> float:
+    """Audio duration from the container header, or a guess from the byte size."""
+    duration = probe_duration(data)
+    if duration is None:
+        duration = len(data) / FALLBACK_BYTES_PER_SECOND
+    return duration
+
+
+queue_depth = metrics.Gauge("voicemask_scheduler_queue_depth", "Work items waiting for a scheduler worker.", ["priority"])
+queue_wait = metrics.Histogram("voicemask_scheduler_wait_seconds", "Time work items spent queued before starting.", ["priority"])
+
+
+class _Item:
+    __slots__ = ("priority", "cost", "fn", "args", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, priority, cost, fn, args, kwargs):
+        self.priority = priority
+        self.cost = cost
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.time()
+
+
+class Scheduler:
+    """
+    Worker pool whose queue runs cheap, high-priority work first.
+
+    Each item is ranked by its priority class, then by estimated cost
+    (shortest job first). Waiting lowers an item's rank at AGING_RATE, so
+    long or low-priority items are delayed but never starved. Since every
+    queued item ages at the same rate, the rank can be fixed at submit time.
+    """
+
+    def __init__(self, workers: int, name: str = "sched"):
+        self.workers = workers
+        self.name = name
+        self.counter = itertools.count()
+        self._reset()
+        # Locks and queue inherited from the parent are reset in each forked worker (serve.py)
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.heap = []
+        self.cond = threading.Condition()
+        self.threads = []
+        self.pid = None
+
+    def _start_workers(self):
+        # Started lazily, and again after a fork, since threads don't survive fork()
+        if self.pid != os.getpid():
+            self.threads = [
+                threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self.threads:
+                thread.start()
+            self.pid = os.getpid()
+
+    def submit(self, fn, *args, priority: str = "interactive", cost: float = 0.0, **kwargs) -> Future:
+        """
+        Queues fn(*args, **kwargs).
+
+        Args:
+            priority (str): Key of PRIORITIES.
+            cost (float): Estimated seconds of work, see estimate_cost.
+
+        Returns:
+            Future: Resolves to fn's result or exception.
+        """
+        item = _Item(priority, cost, fn, args, kwargs)
+        rank = PRIORITIES[priority] * CLASS_OFFSET_SECONDS + cost + AGING_RATE * item.enqueued_at
+        with self.cond:
+            self._start_workers()
+            heapq.heappush(self.heap, (rank, next(self.counter), item))
+            queue_depth.inc(priority=priority)
+            self.cond.notify()
+        return item.future
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                _, _, item = heapq.heappop(self.heap)
+                queue_depth.dec(priority=item.priority)
+
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            queue_wait.observe(time.time() - item.enqueued_at, priority=item.priority)
+            try:
+                item.future.set_result(item.fn(*item.args, **item.kwargs))
+            except BaseException as e:
+                item.future.set_exception(e)
+
+
+scheduler = Scheduler(SCHEDULER_WORKERS)
+
+
+def submit(fn, *args, priority: str = "interactive", cost: float = 0.0, **kwargs) -> Future:
+    """Queues work on the shared pipeline scheduler."""
+    return scheduler.submit(fn, *args, priority=priority, cost=cost, **kwargs)
+
+
+def run(fn, *args, priority: str = "interactive", cost: float = 0.0, cancel=None, **kwargs):
+    """
+    Queues work on the shared pipeline scheduler and blocks until it has run.
+    Cancelling the optional CancelToken drops the work if it hasn't started.
+    """
+    future = scheduler.submit(fn, *args, priority=priority, cost=cost, **kwargs)
+    if cancel is not None:
+        cancel.add_callback(future.cancel)
+    try:
+        return future.result()
+    except CancelledError:
+        cancel.check("queue")
+        raise
@@ -0,0 +1,163 @@
+# serve.py
+"""
+Preload-and-fork launcher.
+
+Loads every model once in this parent process, freezes the weights, then
+forks N uvicorn workers on a shared listening socket. Workers inherit the
+weight pages copy-on-write, so N workers cost roughly one copy of the
+weights plus each worker's private heap instead of N full copies.
+
+    python serve.py --workers 4 --port 8000
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import threading
+
+import torch # type: ignore
+import uvicorn
+
+import metrics
+import model_registry
+
+
+def _modules(obj):
+    """Yields the torch modules held by a model wrapper (or the module itself)."""
+    if isinstance(obj, torch.nn.Module):
+        yield obj
+        return
+    for value in vars(obj).values():
+        if isinstance(value, torch.nn.Module):
+            yield value
+
+
+def freeze_models():
+    """Puts preloaded models in inference mode so no worker ever writes to weight pages."""
+    for name, model in model_registry.loaded().items():
+        for module in _modules(model):
+            module.eval()
+            for param in module.parameters():
+                param.requires_grad_(False)
+    # Move everything allocated so far out of the collector's reach; GC passes in the
+    # workers would otherwise touch (and so copy) every long-lived object's page.
+    gc.collect()
+    gc.freeze()
+
+
+def memory_report(pid: int) -> dict:
+    """Rss/Pss/shared/private memory of a process in MiB, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": round(fields.get("Rss", 0), 1),
+        "pss": round(fields.get("Pss", 0), 1),
+        "shared": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+        "private": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1),
+    }
+
+
+def log_memory(pids):
+    for pid in [os.getpid()] + list(pids):
+        try:
+            print(f"[INFO] Memory pid={pid} (MiB): {memory_report(pid)}")
+        except OSError:
+            pass
+
+
+def run_worker(sock, args, threads):
+    torch.set_num_threads(threads)
+    metrics.set_worker(str(os.getpid()))
+    config = uvicorn.Config("main:app", log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "2")))
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="torch intra-op threads (default: cores / workers)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--memory-report-after", type=float, default=60.0,
+                        help="seconds after start to log per-process memory (0 disables)")
+    args = parser.parse_args()
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+
+    print(f"[INFO] Preloading models in parent pid={os.getpid()} ...")
+    before = memory_report(os.getpid())
+    model_registry.load_all()
+    if not model_registry.is_ready():
+        sys.exit("[ERROR] Required models failed to load; not forking workers")
+    import main as _app  # noqa: F401  import the app once so workers share its modules too
+    freeze_models()
+    print(f"[INFO] Parent memory before/after preload (MiB): {before} -> {memory_report(os.getpid())}")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    workers = {}
+    stopping = threading.Event()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(sock, args, threads)
+            finally:
+                os._exit(0)
+        workers[pid] = time.time()
+        print(f"[INFO] Started worker pid={pid} with {threads} torch thread(s)")
+
+    def shutdown(signum, frame):
+        stopping.set()
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for _ in range(args.workers):
+        spawn()
+
+    if args.memory_report_after > 0:
+        timer = threading.Timer(args.memory_report_after, lambda: log_memory(list(workers)))
+        timer.daemon = True
+        timer.start()
+
+    # Supervise: reap exited workers and replace them from the still-warm parent
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.pop(pid, None)
+        if not stopping.is_set():
+            print(f"[ERROR] Worker pid={pid} exited with status {status}; restarting")
+            spawn()
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# session.py
+import os
+import json
+import asyncio
+from collections import deque
+
+import numpy as np
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from audio_io import DecodedAudio
+from encoding import MIN_SAMPLE_RATE, MAX_SAMPLE_RATE
+from transcribe import transcribe_audio
+from rewrite import rewrite_text_async
+from utils import float_to_pcm16
+from pipeline import ToneEnum, clean_for_tts
+from voice_cloning import stream_cloned_speech, has_cached_se, OUTPUT_SAMPLE_RATE
+
+router = APIRouter()
+
+WHISPER_SAMPLE_RATE = 16000
+FRAME_MS = 30
+VAD_THRESHOLD_DB = float(os.getenv("SESSION_VAD_THRESHOLD_DB", "-40"))  # frame RMS in dBFS
+END_SILENCE_MS = int(os.getenv("SESSION_END_SILENCE_MS", "700"))  # silence that closes an utterance
+PREROLL_MS = 300  # audio kept from before speech onset so first syllables aren't clipped
+MIN_UTTERANCE_MS = 300
+MAX_UTTERANCE_SECONDS = 30  # one Whisper window; longer speech is flushed in pieces
+MAX_PENDING_UTTERANCES = 2  # utterances waiting for the model before new ones are dropped
+HISTORY_SIZE = 20
+
+
+class RingBuffer:
+    """Fixed-capacity float32 sample buffer that overwrites its oldest samples."""
+
+    def __init__(self, capacity: int):
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def free(self):
+        return self.capacity - self.size
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        end = (self.start + self.size) % self.capacity
+        first = min(n, self.capacity - end)
+        self.buffer[end:end + first] = samples[:first]
+        self.buffer[:n - first] = samples[first:]
+
+        overflow = max(0, self.size + n - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.size = min(self.capacity, self.size + n)
+
+    def read(self):
+        idx = (self.start + np.arange(self.size)) % self.capacity
+        return self.buffer[idx]
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+
+class UtteranceSegmenter:
+    """
+    Energy-based VAD that turns a stream of mono samples into utterances.
+
+    Memory is bounded by the pre-roll and utterance ring buffers regardless
+    of how long the session runs.
+    """
+
+    def __init__(self, sample_rate=WHISPER_SAMPLE_RATE):
+        self.frame_len = sample_rate * FRAME_MS // 1000
+        self.sample_rate = sample_rate
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.preroll = RingBuffer(sample_rate * PREROLL_MS // 1000)
+        self.utterance = RingBuffer(sample_rate * MAX_UTTERANCE_SECONDS)
+        self.in_speech = False
+        self.silence_ms = 0
+
+    def push(self, samples):
+        """Feeds samples and returns the list of utterances they completed."""
+        done = []
+        self.pending = np.concatenate([self.pending, samples])
+        n_frames = len(self.pending) // self.frame_len
+
+        for i in range(n_frames):
+            frame = self.pending[i * self.frame_len:(i + 1) * self.frame_len]
+            rms = np.sqrt(np.mean(frame ** 2)) + 1e-10
+            voiced = 20 * np.log10(rms) > VAD_THRESHOLD_DB
+
+            if not self.in_speech:
+                if voiced:
+                    self.in_speech = True
+                    self.silence_ms = 0
+                    self.utterance.write(self.preroll.read())
+                    self.preroll.clear()
+                    self.utterance.write(frame)
+                else:
+                    self.preroll.write(frame)
+                continue
+
+            if self.utterance.free() < len(frame):
+                done.append(self.flush())
+                self.in_speech = True
+
+            self.utterance.write(frame)
+            self.silence_ms = 0 if voiced else self.silence_ms + FRAME_MS
+            if self.silence_ms >= END_SILENCE_MS:
+                done.append(self.flush())
+
+        self.pending = self.pending[n_frames * self.frame_len:]
+        return [u for u in done if u is not None]
+
+    def flush(self):
+        """Closes the current utterance, returning its samples or None if too short."""
+        audio = self.utterance.read()
+        self.utterance.clear()
+        self.in_speech = False
+        self.silence_ms = 0
+        if len(audio) < self.sample_rate * MIN_UTTERANCE_MS // 1000:
+            return None
+        return audio
+
+
+async def _handle_utterance(websocket, utterance_id, audio, tone, user_id, history):
+    original = await run_in_threadpool(transcribe_audio, audio)
+    if not original:
+        return
+
+    rewritten = await rewrite_text_async(original, tone)
+    history.append({"id": utterance_id, "original": original, "rewritten": rewritten})
+    await websocket.send_json({
+        "event": "utterance",
+        "id": utterance_id,
+        "original": original,
+        "rewritten": rewritten,
+        "tone": tone,
+    })
+
+    await websocket.send_json({"event": "audio_start", "id": utterance_id, "sample_rate": OUTPUT_SAMPLE_RATE})
+    sentences = stream_cloned_speech(None, clean_for_tts(rewritten), user_id)
+    while True:
+        chunk = await run_in_threadpool(next, sentences, None)
+        if chunk is None:
+            break
+        await websocket.send_bytes(float_to_pcm16(chunk))
+    await websocket.send_json({"event": "audio_end", "id": utterance_id})
+
+
+async def _process_utterances(websocket, queue, state, user_id, history):
+    while True:
+        utterance_id, audio = await queue.get()
+        try:
+            await _handle_utterance(websocket, utterance_id, audio, state["tone"], user_id, history)
+        except WebSocketDisconnect:
+            return
+        except Exception as e:
+            print(f"[ERROR] Session utterance {utterance_id} failed:", str(e))
+            try:
+                await websocket.send_json({"event": "error", "id": utterance_id, "detail": str(e)})
+            except Exception:
+                # The client is gone; nothing more can be sent on this session
+                return
+
+
+@router.websocket("/ws/session")
+async def voice_session(
+    websocket: WebSocket,
+    user_id: str,
+    tone: ToneEnum = ToneEnum.confident,
+    sample_rate: int = WHISPER_SAMPLE_RATE
+):
+    """
+    Real-time rewrite session.
+
+    The client streams 16-bit little-endian mono PCM as binary frames and may
+    send JSON text frames: {"tone": "..."} to switch tone, {"event": "flush"}
+    to close the current utterance and {"event": "history"} for the recent
+    rewrites. For each utterance the server sends an "utterance" JSON event,
+    then "audio_start", binary PCM at the announced sample rate per
+    synthesized sentence, and "audio_end". Audio is segmented at the
+    client's sample rate and each utterance is resampled to 16 kHz as a
+    whole. Malformed frames get an "error" event and are otherwise ignored.
+    """
+    await websocket.accept()
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        await websocket.close(code=4400, reason=f"sample_rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE} Hz")
+        return
+    if not has_cached_se(user_id):
+        await websocket.close(code=4403, reason="Voice setup required")
+        return
+
+    state = {"tone": tone.value}
+    history = deque(maxlen=HISTORY_SIZE)
+    segmenter = UtteranceSegmenter(sample_rate)
+    queue = asyncio.Queue(maxsize=MAX_PENDING_UTTERANCES)
+    worker = asyncio.create_task(_process_utterances(websocket, queue, state, user_id, history))
+    next_id = 0
+
+    async def enqueue(audio):
+        nonlocal next_id
+        next_id += 1
+        if queue.full():
+            await websocket.send_json({"event": "dropped", "id": next_id, "detail": "Server busy"})
+            return
+        queue.put_nowait((next_id, DecodedAudio(audio, sample_rate)))
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes") is not None:
+                if len(message["bytes"]) % 2:
+                    await websocket.send_json({"event": "error", "detail": "Binary frames must hold whole 16-bit samples"})
+                    continue
+                samples = np.frombuffer(message["bytes"], dtype="<i2").astype(np.float32) / 32768.0
+                for audio in segmenter.push(samples):
+                    await enqueue(audio)
+                continue
+
+            try:
+                control = json.loads(message.get("text") or "{}")
+            except ValueError:
+                control = None
+            if not isinstance(control, dict):
+                await websocket.send_json({"event": "error", "detail": "Text frames must be JSON objects"})
+                continue
+            if control.get("tone") in ToneEnum.__members__:
+                state["tone"] = control["tone"]
+            if control.get("event") == "history":
+                await websocket.send_json({"event": "history", "items": list(history)})
+            if control.get("event") == "flush":
+                audio = segmenter.flush()
+                if audio is not None:
+                    await enqueue(audio)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        worker.cancel()
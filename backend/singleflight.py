@@ -0,0 +1,75 @@
+# singleflight.py
+import threading
+
+import metrics
+
+shared_calls = metrics.Counter(
+    "voicemask_singleflight_shared_total",
+    "Calls that attached to an identical in-flight computation instead of running it again.",
+    ["group"],
+)
+
+_groups = []
+
+
+def _in_flight():
+    return {(group.name,): len(group.calls) for group in _groups}
+
+
+metrics.Gauge("voicemask_singleflight_in_flight", "Distinct computations currently running per group.", ["group"], function=_in_flight)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one computation.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running block until it finishes and get the same result (or
+    exception). Nothing is remembered afterwards; pair with a cache for that.
+
+    Waiters whose shared call failed with one of retry_on (e.g. the running
+    caller's own client went away) start over instead of inheriting the error.
+    """
+
+    def __init__(self, name: str, retry_on=()):
+        self.name = name
+        self.retry_on = tuple(retry_on)
+        self.calls = {}
+        self.lock = threading.Lock()
+        _groups.append(self)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) unless a call with key is already running, in which case waits for that one."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            shared_calls.inc(group=self.name)
+            print(f"[INFO] Joining in-flight {self.name} computation")
+            call.done.wait()
+            if isinstance(call.error, self.retry_on):
+                return self.do(key, fn, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
@@ -0,0 +1,40 @@
+# tests/test_scheduler_fork.py
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import scheduler
+from microbatch import MicroBatcher
+
+
+def _run_in_child(fn):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = fn()
+        except BaseException:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    return os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+
+def test_forked_child_runs_submitted_work():
+    # serve.py imports the app (and so the scheduler) in the parent, then forks workers
+    assert scheduler.submit(lambda: "parent").result(timeout=5) == "parent"
+
+    assert _run_in_child(lambda: scheduler.submit(lambda: os.getpid()).result(timeout=5) == os.getpid())
+
+    # The parent's pool keeps working too
+    assert scheduler.run(lambda: "still here") == "still here"
+
+
+def test_forked_child_runs_micro_batches():
+    batcher = MicroBatcher("fork-test", lambda items: [(os.getpid(), item) for item in items], max_wait_ms=1)
+    assert batcher.submit("parent").result(timeout=5) == (os.getpid(), "parent")
+
+    assert _run_in_child(lambda: batcher.submit("child").result(timeout=5) == (os.getpid(), "child"))
+
+    assert batcher.submit("again").result(timeout=5) == (os.getpid(), "again")
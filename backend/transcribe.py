@@ -1,34 +1,299 @@
 # transcribe.py
 import whisper
 import os
+import hashlib
+import threading
+import torch # type: ignore
+import numpy as np
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
-# Lazy-loaded model (initialized as None)
-model = None
-WHISPER_MODEL_SIZE = "tiny"  # or "base" — smaller models for t2.micro
+import metrics
+import admission
+import model_registry
+from cancel import checkpoint
+from microbatch import MicroBatcher
+from cache import LRUCache, SQLiteCache, TieredCache
+from audio_io import DecodedAudio
+from model_registry import WHISPER_MODEL_SIZE, WHISPER_INT8, TRANSCRIBE_ENGINE, FASTER_WHISPER_COMPUTE_TYPE, TRANSCRIBE_CHUNK_WORKERS
 
-def transcribe_audio(audio_path: str) -> str:
+# faster-whisper decoding options; beam 1 is greedy, like the openai-whisper path
+BEAM_SIZE = int(os.getenv("TRANSCRIBE_BEAM_SIZE", "1"))
+VAD_FILTER = os.getenv("TRANSCRIBE_VAD_FILTER", "1") != "0"  # skip silence before decoding
+
+# openai-whisper clips of up to 30 s from concurrent requests are decoded together
+MICROBATCH_ENABLED = os.getenv("TRANSCRIBE_MICROBATCH", "1") != "0"
+MICROBATCH_SIZE = int(os.getenv("TRANSCRIBE_MICROBATCH_SIZE", "8"))
+MICROBATCH_WAIT_MS = float(os.getenv("TRANSCRIBE_MICROBATCH_WAIT_MS", "10"))
+
+# In-memory clips longer than one 30 s window are cut at pauses and the pieces decoded concurrently
+CHUNK_LONG_AUDIO = os.getenv("TRANSCRIBE_CHUNK_LONG_AUDIO", "1") != "0"
+CHUNK_MAX_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_MAX_SECONDS", "28"))
+CHUNK_PAD_SECONDS = 0.2  # kept around each speech span so word edges aren't clipped
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Transcripts by decoded-PCM fingerprint, so re-running a clip in another tone skips Whisper
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "2000"))
+TRANSCRIPT_CACHE_DISK_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_DISK_MAX_ENTRIES", "100000"))
+TRANSCRIPT_CACHE_TTL_SECONDS = int(os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", os.path.join(BASE_DIR, "cache", "transcripts.sqlite3"))
+
+# Identifies what produced a transcript, for cache keys
+if TRANSCRIBE_ENGINE == "faster-whisper":
+    TRANSCRIBER_VERSION = f"faster-whisper:{WHISPER_MODEL_SIZE}:{FASTER_WHISPER_COMPUTE_TYPE}:beam{BEAM_SIZE}:vad{int(VAD_FILTER)}"
+else:
+    TRANSCRIBER_VERSION = f"whisper:{WHISPER_MODEL_SIZE}" + (":int8" if WHISPER_INT8 else "")
+
+transcript_cache = TieredCache(
+    LRUCache(TRANSCRIPT_CACHE_MAX_ENTRIES, TRANSCRIPT_CACHE_TTL_SECONDS),
+    SQLiteCache(TRANSCRIPT_CACHE_PATH, TRANSCRIPT_CACHE_DISK_MAX_ENTRIES, TRANSCRIPT_CACHE_TTL_SECONDS) if TRANSCRIPT_CACHE_PATH else None,
+)
+metrics.register_cache("transcript", transcript_cache)
+if transcript_cache.disk is not None:
+    metrics.register_cache("transcript_disk", transcript_cache.disk)
+
+
+# openai-whisper installs kv-cache hooks on the shared decoder for each decode, so two
+# decodes on one model at once read each other's caches; every decode holds its model's lock
+_whisper_locks = {}
+_whisper_locks_lock = threading.Lock()
+os.register_at_fork(after_in_child=_whisper_locks.clear)
+
+
+def whisper_lock(model) -> threading.Lock:
+    with _whisper_locks_lock:
+        return _whisper_locks.setdefault(id(model), threading.Lock())
+
+
+def run_whisper(model, audio) -> str:
+    """Transcribes a path or 16 kHz samples with an openai-whisper model."""
+    with whisper_lock(model), torch.inference_mode():
+        return model.transcribe(audio).get("text", "").strip()
+
+
+def run_faster_whisper(model, audio, beam_size: int = BEAM_SIZE, vad_filter: bool = VAD_FILTER) -> str:
+    """Transcribes a path or 16 kHz samples with a faster-whisper model."""
+    segments, _ = model.transcribe(audio, beam_size=beam_size, vad_filter=vad_filter)
+    # segments is lazy; decoding happens while it is consumed
+    return "".join(segment.text for segment in segments).strip()
+
+
+def decode_padded(model, audios) -> list:
+    """
+    Decodes clips of up to 30 s in one forward pass: each log-mel input is
+    padded to whisper's 30 s window and the batch goes through the encoder
+    and decoder together.
+
+    Args:
+        audios (list[np.ndarray]): Mono float32 samples at 16 kHz.
+
+    Returns:
+        list[str]: Transcripts in input order.
+    """
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(audio.astype(np.float32, copy=False)), model.dims.n_mels)
+        for audio in audios
+    ]).to(model.device)
+    options = whisper.DecodingOptions(fp16=model.device.type != "cpu")
+    with whisper_lock(model), torch.inference_mode():
+        return [result.text.strip() for result in whisper.decode(model, mels, options)]
+
+
+def _decode_microbatch(audios):
+    with admission.stage("transcribe"), metrics.stage("transcribe_batch"):
+        return decode_padded(model_registry.get_whisper(), audios)
+
+
+whisper_batcher = MicroBatcher("transcribe", _decode_microbatch, MICROBATCH_SIZE, MICROBATCH_WAIT_MS)
+
+
+def plan_chunks(segments, total_samples: int, max_samples: int, pad_samples: int = 0) -> list:
+    """
+    Groups VAD speech segments into chunks that each fit one decode window.
+
+    Neighbouring segments are merged while the merged span stays within
+    max_samples; a single segment longer than that is cut into equal parts.
+
+    Args:
+        segments (list[tuple[int, int]]): (start, end) sample indices of speech.
+        total_samples (int): Length of the audio, to clamp padding.
+        max_samples (int): Longest chunk allowed.
+        pad_samples (int): Context added on both sides of each chunk.
+
+    Returns:
+        list[tuple[int, int]]: (start, end) sample indices per chunk, in order.
+    """
+    limit = max_samples - 2 * pad_samples
+    pieces = []
+    for start, end in segments:
+        parts = max(1, int(np.ceil((end - start) / limit)))
+        bounds = [int(b) for b in np.linspace(start, end, parts + 1)]
+        pieces.extend(zip(bounds[:-1], bounds[1:]))
+
+    chunks = []
+    for start, end in pieces:
+        if chunks and end - chunks[-1][0] <= limit:
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+    return [(max(0, s - pad_samples), min(total_samples, e + pad_samples)) for s, e in chunks]
+
+
+def transcribe_segments(audio, cancel=None) -> list:
+    """
+    Transcribes a long clip by VAD-segmenting it into pieces of at most
+    CHUNK_MAX_SECONDS and decoding the pieces concurrently: as padded
+    batches with openai-whisper, or on TRANSCRIBE_CHUNK_WORKERS threads
+    with faster-whisper. Decoding time so scales with cores, not duration.
+
+    Args:
+        audio (np.ndarray): Mono float32 samples at 16 kHz.
+        cancel (CancelToken): Optional; checked between batches and chunks.
+
+    Returns:
+        list[dict]: start and end (seconds) and text per chunk, in order.
+    """
+    from openvoice.se_extractor import vad_speech_segments
+
+    sample_rate = whisper.audio.SAMPLE_RATE
+    with metrics.stage("vad"):
+        speech = vad_speech_segments(audio, min_silence_duration=0.5)
+    chunks = plan_chunks(speech, len(audio), int(CHUNK_MAX_SECONDS * sample_rate), int(CHUNK_PAD_SECONDS * sample_rate))
+    print(f"[INFO] Transcribing {len(audio) / sample_rate:.1f}s as {len(chunks)} VAD chunk(s) ...")
+
+    pieces = [audio[start:end] for start, end in chunks]
+    model = model_registry.get_transcriber()
+    texts = []
+    with admission.stage("transcribe"), metrics.stage("transcribe"):
+        if TRANSCRIBE_ENGINE == "faster-whisper":
+            def decode(piece):
+                checkpoint(cancel, "transcribe")
+                return run_faster_whisper(model, piece, vad_filter=False)
+
+            with ThreadPoolExecutor(max_workers=TRANSCRIBE_CHUNK_WORKERS) as pool:
+                texts = list(pool.map(decode, pieces))
+        else:
+            for i in range(0, len(pieces), MICROBATCH_SIZE):
+                checkpoint(cancel, "transcribe")
+                texts.extend(decode_padded(model, pieces[i:i + MICROBATCH_SIZE]))
+
+    return [
+        {"start": round(start / sample_rate, 2), "end": round(end / sample_rate, 2), "text": text}
+        for (start, end), text in zip(chunks, texts) if text
+    ]
+
+
+def audio_fingerprint(samples) -> str:
+    """Hash of decoded PCM, so the same speech matches whatever container it came in."""
+    return hashlib.sha256(np.ascontiguousarray(samples, dtype=np.float32).tobytes()).hexdigest()
+
+
+def _cache_key(samples) -> str:
+    return f"{audio_fingerprint(samples)}:{TRANSCRIBER_VERSION}"
+
+
+def transcribe_audio(audio_path, cancel=None) -> str:
     """
-    Transcribes speech from a WAV audio file into text.
+    Transcribes speech from a WAV audio file into text, using the engine
+    selected by TRANSCRIBE_ENGINE. In-memory audio is looked up in
+    transcript_cache first. With openai-whisper, in-memory clips of up to
+    30 s are micro-batched with other requests' clips; longer in-memory
+    clips go through transcribe_segments.
 
     Args:
-        audio_path (str): Path to the audio file.
+        audio_path (str | DecodedAudio | np.ndarray): Path to the audio file,
+            decoded audio, or mono float32 samples already at 16 kHz.
+        cancel (CancelToken): Optional; checked once a transcribe slot is free.
 
     Returns:
         str: The transcribed text.
     """
-    global model
+    if isinstance(audio_path, DecodedAudio):
+        audio_path = audio_path.resample(whisper.audio.SAMPLE_RATE)
 
-    if model is None:
-        print(f"[INFO] Loading Whisper model ({WHISPER_MODEL_SIZE}) ...")
-        model = whisper.load_model(WHISPER_MODEL_SIZE)
-        print(f"[INFO] Model loaded.")
+    if isinstance(audio_path, np.ndarray):
+        audio_path = audio_path.astype(np.float32, copy=False)
+        key = _cache_key(audio_path)
+        text = transcript_cache.get(key)
+        if text is not None:
+            print(f"[INFO] Transcript cache hit: {text}")
+            return text
 
-    if not os.path.exists(audio_path):
+        print(f"[INFO] Transcribing {len(audio_path) / whisper.audio.SAMPLE_RATE:.1f}s of in-memory audio ...")
+        text = _transcribe_samples(audio_path, cancel)
+        transcript_cache.put(key, text)
+    elif not os.path.exists(audio_path):
         raise FileNotFoundError(f"Audio file not found: {audio_path}")
-
-    print(f"[INFO] Transcribing {audio_path} ...")
-    result = model.transcribe(audio_path)
-    text = result.get("text", "").strip()
+    else:
+        print(f"[INFO] Transcribing {audio_path} ...")
+        with admission.stage("transcribe"), metrics.stage("transcribe"):
+            checkpoint(cancel, "transcribe")
+            text = _run_model(model_registry.get_transcriber(), audio_path)
 
     print(f"[INFO] Transcription complete: {text}")
     return text
+
+
+def _run_model(model, audio) -> str:
+    if TRANSCRIBE_ENGINE == "faster-whisper":
+        return run_faster_whisper(model, audio)
+    return run_whisper(model, audio)
+
+
+def _transcribe_samples(audio, cancel=None) -> str:
+    checkpoint(cancel, "transcribe")
+    if CHUNK_LONG_AUDIO and len(audio) > whisper.audio.N_SAMPLES:
+        return " ".join(segment["text"] for segment in transcribe_segments(audio, cancel))
+
+    if MICROBATCH_ENABLED and TRANSCRIBE_ENGINE == "whisper" and len(audio) <= whisper.audio.N_SAMPLES:
+        future = whisper_batcher.submit(audio)
+        if cancel is not None:
+            cancel.add_callback(future.cancel)  # drops the clip if its batch hasn't started
+        with metrics.stage("transcribe"):
+            try:
+                return future.result()
+            except CancelledError:
+                cancel.check("transcribe")
+                raise
+
+    model = model_registry.get_transcriber()
+    with admission.stage("transcribe"), metrics.stage("transcribe"):
+        checkpoint(cancel, "transcribe")
+        return _run_model(model, audio)
+
+
+def transcribe_batch(audios, cancel=None) -> list:
+    """
+    Transcribes several clips, decoding every uncached clip of up to 30 s in
+    a single padded batch. Longer clips fall back to transcribe_audio one by
+    one, as do all clips with the faster-whisper engine, which has no
+    batched decode.
+
+    Args:
+        audios (list[np.ndarray]): Mono float32 samples at 16 kHz.
+        cancel (CancelToken): Optional; checked before each decode.
+
+    Returns:
+        list[str]: Transcripts in input order.
+    """
+    if TRANSCRIBE_ENGINE == "faster-whisper":
+        return [transcribe_audio(audio, cancel) for audio in audios]
+
+    model = model_registry.get_whisper()
+    keys = [_cache_key(audio) for audio in audios]
+    texts = [transcript_cache.get(key) for key in keys]
+    short = [i for i, audio in enumerate(audios) if texts[i] is None and len(audio) <= whisper.audio.N_SAMPLES]
+
+    if short:
+        print(f"[INFO] Batch-decoding {len(short)} clip(s) ...")
+        with admission.stage("transcribe"), metrics.stage("transcribe"):
+            checkpoint(cancel, "transcribe")
+            results = decode_padded(model, [audios[i] for i in short])
+        for i, text in zip(short, results):
+            texts[i] = text
+            transcript_cache.put(keys[i], text)
+
+    for i, audio in enumerate(audios):
+        if texts[i] is None:
+            texts[i] = transcribe_audio(audio, cancel)
+    return texts
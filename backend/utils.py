@@ -1,17 +1,22 @@
 from pydub import AudioSegment
 from datetime import datetime
 import json
+import struct
+import numpy as np
 
 def convert_to_wav(input_path, output_path):
     audio = AudioSegment.from_file(input_path)
     audio.export(output_path, format='wav')
 
-def log_interaction(tone, input_text, output_text, path="history.jsonl"):
+def log_interaction(tone, input_text, output_text, path="history.jsonl", model=None, temperature=None, prompt_version=None):
     record = {
         "timestamp": datetime.utcnow().isoformat(),
         "tone": tone,
         "input": input_text,
-        "output": output_text
+        "output": output_text,
+        "model": model,
+        "temperature": temperature,
+        "prompt_version": prompt_version
     }
     with open(path, "a", encoding="utf-8") as f:
         f.write(json.dumps(record) + "\n")
@@ -20,3 +25,18 @@ def ensure_dir(path: str):
     import os
     if not os.path.exists(path):
         os.makedirs(path)
+
+
+def wav_stream_header(sample_rate, channels=1, bits_per_sample=16):
+    # RIFF/data sizes are unknown while streaming; 0xFFFFFFFF tells players to read until EOF
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+def float_to_pcm16(audio):
+    audio = np.clip(np.asarray(audio, dtype=np.float32), -1.0, 1.0)
+    return (audio * 32767).astype("<i2").tobytes()
@@ -1,70 +1,169 @@
 # voice_cloning.py
 import os
 import torch # type: ignore
-from openvoice.api import ToneColorConverter 
+import soundfile
 from openvoice import se_extractor 
-
-import sys
-import os
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "openVoice")))
-
-from melo.api import TTS as MeloTTS # type: ignore
+from openvoice.utils import split_sentence
+import metrics
+import admission
+import model_registry
+from cancel import checkpoint
+from audio_io import DecodedAudio
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CHECKPOINTS_DIR = os.path.join(BASE_DIR, "checkpoints")
 SE_DIR = os.path.join(BASE_DIR, "se_cache")
 
-# Load model
-device = "cuda" if torch.cuda.is_available() else "cpu"
-tone_color_converter = ToneColorConverter(
-    os.path.join(CHECKPOINTS_DIR, "converter", "config.json"), device=device
-)
-tone_color_converter.load_ckpt(
-    os.path.join(CHECKPOINTS_DIR, "converter", "checkpoint.pth")
-)
+OUTPUT_SAMPLE_RATE = model_registry.CONVERTER_SAMPLE_RATE
+
+
+def has_cached_se(user_id):
+    return bool(user_id) and os.path.exists(os.path.join(SE_DIR, f"{user_id}_se.pth"))
+
+
+def se_version(user_id):
+    """Identifies the user's current cached embedding, so results made with an older one aren't reused."""
+    se_path = os.path.join(SE_DIR, f"{user_id}_se.pth") if user_id else None
+    if se_path and os.path.exists(se_path):
+        return str(os.path.getmtime(se_path))
+    return "none"
+
+
+def load_target_se(ref_audio, user_id=None):
+    """
+    Loads the user's cached speaker embedding, or extracts one from
+    ref_audio (a DecodedAudio, or a file path for older callers).
+    """
+    se_path = os.path.join(SE_DIR, f"{user_id}_se.pth") if user_id else None
+    if user_id and os.path.exists(se_path):
+        print(f"[INFO] Using cached speaker embedding for user_id={user_id}")
+        with metrics.stage("se_load"):
+            return torch.load(se_path, map_location=model_registry.device)
+
+    print("[INFO] Extracting speaker embedding...")
+    with admission.stage("setup"), metrics.stage("se_extract"):
+        if isinstance(ref_audio, DecodedAudio):
+            ref_audio = ref_audio.resample(OUTPUT_SAMPLE_RATE)
+        target_se, _ = se_extractor.get_se(ref_audio, model_registry.get_converter(), vad=True)
+    if user_id:
+        os.makedirs(SE_DIR, exist_ok=True)
+        torch.save(target_se, se_path)
+    return target_se
+
+
+def _base_tts(text, cancel=None):
+    # Neutral MeloTTS voice, returned in memory at melo's sampling rate. Spoken a
+    # sentence at a time (joined the way melo joins its own pieces) so a cancelled
+    # request stops at the next sentence boundary.
+    melo_tts = model_registry.get_melo()
+    speaker_id = list(melo_tts.hps.data.spk2id.values())[0]
+    pieces = []
+    with metrics.stage("tts_base"):
+        for sentence in split_sentence(text, language_str="EN") or [text]:
+            checkpoint(cancel, "tts_base")
+            pieces.append(melo_tts.tts_to_file(sentence, speaker_id, None, speed=1.0))
+    return melo_tts.audio_numpy_concat(pieces, sr=melo_tts.hps.data.sampling_rate, speed=1.0)
+
 
+def render_cloned_speech(target_se, text, output_path=None, cancel=None, wait=False):
+    """
+    Speaks text with the neutral base voice and converts it to target_se.
+    An optional CancelToken is checked between sentences and stages.
+    wait queues for the synthesize slot instead of raising Overloaded.
 
-melo_tts = MeloTTS(language="EN", device=device)
+    Returns:
+        numpy.ndarray: float32 audio at OUTPUT_SAMPLE_RATE, also written to
+        output_path when one is given.
+    """
+    converter = model_registry.get_converter()
+    with admission.stage("synthesize", wait=wait):
+        base_audio = _base_tts(text, cancel)
+        checkpoint(cancel, "tone_convert")
+        with metrics.stage("tone_convert"):
+            audio = converter.convert(
+                audio_src_path=base_audio,
+                src_se=None,
+                tgt_se=target_se,
+                output_path=None,
+                src_sample_rate=model_registry.get_melo().hps.data.sampling_rate,
+                watermark=False
+            )
+        with metrics.stage("watermark"):
+            audio = converter.add_watermark(audio, "@MyShell", check=lambda: checkpoint(cancel, "watermark"))
+    if output_path is not None:
+        with metrics.stage("file_write"):
+            soundfile.write(output_path, audio, OUTPUT_SAMPLE_RATE)
+    return audio
 
 
-def synthesize_cloned_speech(ref_audio_path, text, output_path, user_id=None, setup_only=False):
+def synthesize_cloned_speech(ref_audio, text, output_path=None, user_id=None, setup_only=False, cancel=None):
+    """
+    Clones ref_audio's (or the user's cached) voice speaking text.
+
+    Returns:
+        numpy.ndarray: float32 audio at OUTPUT_SAMPLE_RATE, also written to
+        output_path when one is given; None when setup_only.
+    """
     try:
-        # Load or extract speaker embedding
-        se_path = os.path.join(SE_DIR, f"{user_id}_se.pth") if user_id else None
-        if user_id and os.path.exists(se_path):
-            print(f"[INFO] Using cached speaker embedding for user_id={user_id}")
-            target_se = torch.load(se_path, map_location=device)
-        else:
-            print("[INFO] Extracting speaker embedding...")
-            target_se, _ = se_extractor.get_se(ref_audio_path, tone_color_converter, vad=True)
-            if user_id:
-                os.makedirs(SE_DIR, exist_ok=True)
-                torch.save(target_se, se_path)
+        target_se = load_target_se(ref_audio, user_id)
 
         if setup_only:
             print("[INFO] Setup only: SE cached without synthesis")
             return
 
-        print(f"[INFO] Synthesizing cloned speech to: {output_path}")
-
-        # Generate neutral voice
-        temp_base_path = output_path.replace(".m4a", "_base.wav")
-        speaker_ids = melo_tts.hps.data.spk2id
-        speaker_id = list(speaker_ids.values())[0]
-        melo_tts.tts_to_file(text, speaker_id, temp_base_path, speed=1.0)
-
-        # Tone conversion
-        tone_color_converter.convert(
-            audio_src_path=temp_base_path,
-            src_se=None,
-            tgt_se=target_se,
-            output_path=output_path,
-            message="@MyShell"
-        )
-
-        if os.path.exists(temp_base_path):
-            os.remove(temp_base_path)
+        print(f"[INFO] Synthesizing cloned speech to: {output_path or 'memory'}")
+        return render_cloned_speech(target_se, text, output_path, cancel)
 
     except Exception as e:
         print("[ERROR] Voice cloning failed:", str(e))
         raise e
+
+
+def stream_cloned_speech(ref_audio, text, user_id=None, target_se=None, committed=False):
+    """
+    Synthesizes cloned speech one sentence at a time. Each sentence takes
+    its own synthesize slot, so no slot is held while the consumer sends
+    the previous one. Pass target_se to skip loading the embedding on the
+    first iteration. With committed, sentences after the first wait for a
+    slot rather than raising Overloaded, since the caller has started a
+    response by then.
+
+    Yields:
+        numpy.ndarray: float32 audio at OUTPUT_SAMPLE_RATE for each sentence,
+        as soon as its tone conversion finishes.
+    """
+    if target_se is None:
+        target_se = load_target_se(ref_audio, user_id)
+    sentences = split_sentence(text, language_str="EN")
+    print(f"[INFO] Streaming {len(sentences)} sentence(s) of cloned speech")
+
+    for i, sentence in enumerate(sentences):
+        yield render_cloned_speech(target_se, sentence, wait=committed and i > 0)
+
+
+def synthesize_cloned_batch(target_se, texts, cancel=None):
+    """
+    Synthesizes several texts for one speaker embedding (see load_target_se),
+    running tone conversion as a single padded batch instead of one forward
+    pass per text.
+
+    Returns:
+        list[numpy.ndarray]: float32 audio at OUTPUT_SAMPLE_RATE per text.
+    """
+    print(f"[INFO] Synthesizing {len(texts)} base clip(s) for batch conversion")
+    converter = model_registry.get_converter()
+    with admission.stage("synthesize"):
+        base_audios = [_base_tts(text, cancel) for text in texts]
+        checkpoint(cancel, "tone_convert")
+
+        with metrics.stage("tone_convert"):
+            converted = converter.convert_batch(
+                base_audios,
+                sample_rate=model_registry.get_melo().hps.data.sampling_rate,
+                src_se=None,
+                tgt_se=target_se,
+                watermark=False
+            )
+        with metrics.stage("watermark"):
+            check = lambda: checkpoint(cancel, "watermark")
+            converted = [converter.add_watermark(audio, "@MyShell", check=check) for audio in converted]
+    return converted
@@ -2,22 +2,26 @@
 import os
 import shutil
 import torch # type: ignore
+import numpy as np
 
 from typing import Optional
 from datetime import datetime
-from pydub import AudioSegment
-from fastapi import APIRouter, UploadFile, File, Form, Query, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, Query, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 
 from openvoice import se_extractor
-from openvoice.api import ToneColorConverter
-from utils import convert_to_wav, ensure_dir
-from voice_cloning import synthesize_cloned_speech
+import admission
+import scheduler
+import model_registry
+import file_store
+from utils import ensure_dir
+from singleflight import SingleFlight
+from audio_io import load_audio
+from voice_cloning import render_cloned_speech
 
 router = APIRouter()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CHECKPOINTS_DIR = os.path.join(BASE_DIR, "checkpoints")
 SE_DIR = os.path.join(BASE_DIR, "se_cache")
 USER_AUDIO_DIR = os.path.join(BASE_DIR, "audio_cache", "users")
 PREVIEWS_DIR = os.path.join(BASE_DIR, "audio_cache", "previews")
@@ -29,12 +33,8 @@ os.makedirs(USER_AUDIO_DIR, exist_ok=True)
 os.makedirs(PREVIEWS_DIR, exist_ok=True)
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
-# Load model once
-converter = ToneColorConverter(
-    config_path=os.path.join(CHECKPOINTS_DIR, "converter", "config.json"),
-    device="cuda" if torch.cuda.is_available() else "cpu"
-)
-converter.load_ckpt(os.path.join(CHECKPOINTS_DIR, "converter", "checkpoint.pth"))
+# Retried /complete calls for the same user share one embedding run
+setup_flight = SingleFlight("setup")
 
 @router.post("/consent")
 def store_user_consent(user_id: str = Form(...), consent: Optional[bool] = Form(False)):
@@ -75,48 +75,53 @@ async def finalize_embedding(user_id: str = Form(...), consent: Optional[bool] =
         raise HTTPException(status_code=400, detail="No prompt audio found")
 
     try:
-        # Concatenate all prompt files
-        combined = AudioSegment.empty()
-        for wav_file in audio_paths:
-            combined += AudioSegment.from_wav(wav_file)
-
-        combined_path = os.path.join(user_dir, "combined.wav")
-        combined.export(combined_path, format="wav")
-
-        # Extract speaker embedding
-        print(f"[INFO] Extracting SE for {user_id}...")
-        se = se_extractor.get_se(combined_path, from_path=True)
-
-        # Conditionally save embedding and log consent
-        if consent:
-            se_path = os.path.join(SE_DIR, f"{user_id}_se.pth")
-            torch.save(se, se_path)
-            with open(CONSENT_LOG, "a") as f:
-                f.write(f"{user_id},{datetime.now().isoformat()}\n")
-
-        # Generate preview audio
-        preview_path = os.path.join(PREVIEWS_DIR, f"{user_id}.wav")
-        dummy_text = "This is a preview of your cloned voice."
-
-        synthesize_cloned_speech(
-            reference_speaker=se,
-            text=dummy_text,
-            output_path=preview_path,
-            converter=converter
-        )
-
+        await run_in_threadpool(setup_flight.do, (user_id, "setup", bool(consent)),
+                                _schedule_embedding, user_id, audio_paths, consent)
         return {"message": "Speaker embedding created", "preview": f"/preview/{user_id}"}
 
+    except admission.Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Embedding failed: {str(e)}")
 
+def _schedule_embedding(user_id, audio_paths, consent):
+    # Setup runs behind interactive /process/ calls, ahead of batch work
+    duration = 0.0
+    for path in audio_paths:
+        with open(path, "rb") as f:
+            duration += scheduler.estimate_duration(f.read())
+    cost = scheduler.estimate_cost(duration, ["setup"])
+    return scheduler.run(_build_embedding, user_id, audio_paths, consent, priority="setup", cost=cost)
+
+def _build_embedding(user_id, audio_paths, consent):
+    # Concatenate all prompt files in memory at the converter's rate
+    sample_rate = model_registry.CONVERTER_SAMPLE_RATE
+    combined = np.concatenate([load_audio(path, sample_rate).samples for path in audio_paths])
+
+    # Extract speaker embedding
+    print(f"[INFO] Extracting SE for {user_id}...")
+    with admission.stage("setup"):
+        se, _ = se_extractor.get_se(combined, model_registry.get_converter(), vad=True)
+
+    # Conditionally save embedding and log consent
+    if consent:
+        se_path = os.path.join(SE_DIR, f"{user_id}_se.pth")
+        torch.save(se, se_path)
+        with open(CONSENT_LOG, "a") as f:
+            f.write(f"{user_id},{datetime.now().isoformat()}\n")
+
+    # Generate preview audio
+    preview_path = os.path.join(PREVIEWS_DIR, f"{user_id}.wav")
+    dummy_text = "This is a preview of your cloned voice."
+    render_cloned_speech(se, dummy_text, preview_path)
+
 @router.get("/preview/{user_id}")
-def serve_voice_preview(user_id: str):
+def serve_voice_preview(user_id: str, request: Request):
     preview_path = os.path.join(PREVIEWS_DIR, f"{user_id}.wav")
     if not os.path.exists(preview_path):
         raise HTTPException(status_code=404, detail="Preview not found")
 
-    return FileResponse(preview_path, media_type="audio/wav")
+    return file_store.file_response(request, preview_path)
 
 @router.get("/has-setup")
 def has_voice_setup(user_id: str = Query(...)):